@@ -3,43 +3,99 @@ Code Golf Scoring Module
 Based on Google Code Golf 2025 competition rules
 """
 
+import hashlib
+import mmap
 import os
 import tempfile
-from typing import Dict, Any, Optional
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple, Hashable
 
-def calculate_code_score(code: str, language: str = "python") -> Dict[str, Any]:
+# Sources longer than this are cached under a digest instead of by value
+LARGE_CODE_CHARS = 4096
+# Files larger than this are memory-mapped instead of read into a buffer
+MMAP_THRESHOLD_BYTES = 64 * 1024
+
+class _LRUCache:
+    """Small thread-safe LRU mapping used to memoize pure scoring results"""
+    
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+    
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+# Scoring is pure over (code, language), so results can be reused freely
+_code_score_cache = _LRUCache(maxsize=4096)
+# File scores keyed by path and invalidated by (mtime, size)
+_file_score_cache = _LRUCache(maxsize=1024)
+
+def _utf8_byte_len(s: str) -> int:
+    """
+    Return the UTF-8 encoded length of a string
+    
+    Pure-ASCII sources (the common case for golf submissions) have one byte
+    per character, so the length is read directly without encoding.
+    """
+    if s.isascii():
+        return len(s)
+    return len(s.encode('utf-8'))
+
+def _code_cache_key(code: str, language: str) -> Tuple[Any, str]:
+    if len(code) > LARGE_CODE_CHARS:
+        # Avoid pinning large sources in memory; a 16-byte digest stands in
+        return (hashlib.blake2b(code.encode('utf-8', 'surrogatepass'), digest_size=16).digest(), language)
+    return (code, language)
+
+def calculate_code_score(code: str, language: str = "python", byte_length: Optional[int] = None) -> Dict[str, Any]:
     """
     Calculate the score for a code golf submission
     
+    Results are memoized by content, so rescoring the same source is a
+    cache lookup. Callers receive their own copy of the result.
+    
     Args:
         code: The source code as string
         language: Programming language (default: python)
+        byte_length: UTF-8 length of code, if the caller already knows it
     
     Returns:
         Dictionary containing score information
     """
     
+    key = _code_cache_key(code, language)
+    score_info = _code_score_cache.get(key)
+    if score_info is None:
+        score_info = _compute_code_score(code, language, byte_length)
+        _code_score_cache.put(key, score_info)
+    return dict(score_info)
+
+def _compute_code_score(code: str, language: str, byte_length: Optional[int] = None) -> Dict[str, Any]:
+    """Uncached implementation of calculate_code_score"""
+    
+    if byte_length is None:
+        byte_length = _utf8_byte_len(code)
+    
     # For code golf, the score is typically the byte length of the source code
     if language.lower() == "python":
-        # Calculate byte length (UTF-8 encoding)
-        byte_length = len(code.encode('utf-8'))
-        
-        # Calculate character length
-        char_length = len(code)
-        
-        # Remove trailing whitespace and count lines
-        lines = code.strip().split('\n')
-        line_count = len(lines)
-        
-        # Calculate effective code (excluding comments and empty lines)
-        effective_lines = []
-        for line in lines:
-            stripped = line.strip()
-            if stripped and not stripped.startswith('#'):
-                effective_lines.append(stripped)
-        
-        effective_code = '\n'.join(effective_lines)
-        effective_byte_length = len(effective_code.encode('utf-8'))
+        byte_length, char_length, line_count, effective_byte_length = _score_python_fast(code, byte_length)
         
         return {
             "byte_length": byte_length,
@@ -53,7 +109,6 @@ def calculate_code_score(code: str, language: str = "python") -> Dict[str, Any]:
     
     else:
         # For other languages, use byte length as well
-        byte_length = len(code.encode('utf-8'))
         return {
             "byte_length": byte_length,
             "char_length": len(code),
@@ -62,6 +117,52 @@ def calculate_code_score(code: str, language: str = "python") -> Dict[str, Any]:
             "scoring_method": "byte_length"
         }
 
+def _score_python_fast(code: str, byte_length: int) -> Tuple[int, int, int, int]:
+    """
+    Scan a Python source for (byte_length, char_length, line_count, effective_byte_length)
+    
+    line_count spans the first to the last non-blank line; the effective
+    length is the byte length of the non-blank, non-comment lines (stripped)
+    re-joined with newlines. The per-line work is done by list
+    comprehensions and builtins rather than an explicit loop body, and ASCII
+    sources (one byte per character) skip the per-line UTF-8 measurement.
+    """
+    char_length = len(code)
+    
+    stripped_lines = [line.strip() for line in code.split('\n')]
+    kept_lines = [line for line in stripped_lines if line]
+    if not kept_lines:
+        return byte_length, char_length, 1, 0
+    
+    first_line = stripped_lines.index(kept_lines[0])
+    last_line = len(stripped_lines) - 1 - stripped_lines[::-1].index(kept_lines[-1])
+    
+    effective_lines = [line for line in kept_lines if line[0] != '#']
+    if byte_length == char_length:
+        effective_bytes = sum(map(len, effective_lines))
+    else:
+        effective_bytes = sum(map(_utf8_byte_len, effective_lines))
+    # Same as len('\n'.join(effective_lines).encode('utf-8')), without
+    # building the joined string: one newline between each pair of lines
+    effective_byte_length = effective_bytes + max(len(effective_lines) - 1, 0)
+    
+    return byte_length, char_length, last_line - first_line + 1, effective_byte_length
+
+def _decode_source(data) -> Tuple[str, Optional[int]]:
+    """
+    Decode raw file contents (bytes or any buffer, such as an mmap)
+    
+    Returns the text and its UTF-8 byte length. For ASCII and valid UTF-8
+    files that is the raw size, so the text doesn't need to be encoded
+    again to measure it; for other files it is None.
+    """
+    try:
+        # The UTF-8 decoder has its own fast path for ASCII input
+        return str(data, 'utf-8'), len(data)
+    except UnicodeDecodeError:
+        # If UTF-8 fails, try with other encodings
+        return str(data, 'latin-1'), None
+
 def calculate_file_score(file_path: str) -> Dict[str, Any]:
     """
     Calculate score for a code file (similar to code_golf_utils.py)
@@ -73,20 +174,32 @@ def calculate_file_score(file_path: str) -> Dict[str, Any]:
         Dictionary containing score information
     """
     
-    if not os.path.exists(file_path):
+    try:
+        st = os.stat(file_path)
+    except FileNotFoundError:
         raise FileNotFoundError(f"File not found: {file_path}")
     
     # Get file size in bytes (like os.path.getsize in the reference code)
-    file_size = os.path.getsize(file_path)
+    file_size = st.st_size
     
-    # Read file content for additional analysis
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-    except UnicodeDecodeError:
-        # If UTF-8 fails, try with other encodings
-        with open(file_path, 'r', encoding='latin-1') as f:
-            content = f.read()
+    # Unchanged files are served from cache without being re-read
+    cached = _file_score_cache.get(file_path)
+    if cached is not None and cached[0] == (st.st_mtime_ns, file_size):
+        return dict(cached[1])
+    
+    # Read file content for additional analysis (once, as bytes). Large
+    # files are decoded straight from the page cache without a read copy.
+    with open(file_path, 'rb') as f:
+        if file_size > MMAP_THRESHOLD_BYTES:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                content, byte_length = _decode_source(mapped)
+        else:
+            content, byte_length = _decode_source(f.read())
+    
+    if '\r' in content:
+        # Match the newline translation of a text-mode read
+        content = content.replace('\r\n', '\n').replace('\r', '\n')
+        byte_length = None
     
     # Determine language from file extension
     _, ext = os.path.splitext(file_path)
@@ -102,7 +215,7 @@ def calculate_file_score(file_path: str) -> Dict[str, Any]:
     language = language_map.get(ext.lower(), 'unknown')
     
     # Calculate detailed score
-    score_info = calculate_code_score(content, language)
+    score_info = calculate_code_score(content, language, byte_length)
     
     # Add file-specific information
     score_info.update({
@@ -111,7 +224,33 @@ def calculate_file_score(file_path: str) -> Dict[str, Any]:
         "file_extension": ext
     })
     
-    return score_info
+    _file_score_cache.put(file_path, ((st.st_mtime_ns, file_size), score_info))
+    return dict(score_info)
+
+def _scan_code_flags(code: str) -> Tuple[bool, int, int, int, bool, bool]:
+    """
+    Collect the facts validate_submission_format needs without splitting the source
+    
+    Returns:
+        (is_blank, triple_double_quotes, triple_single_quotes,
+         trailing_empty_lines, has_tabs, has_spaces)
+    """
+    
+    # Only the trailing whitespace run is inspected for blank lines
+    content_end = len(code.rstrip())
+    trailing_empty_lines = code.count('\n', content_end)
+    if content_end == 0:
+        # A blank source is made entirely of empty lines
+        trailing_empty_lines += 1
+    
+    return (
+        content_end == 0,
+        code.count('"""'),
+        code.count("'''"),
+        trailing_empty_lines,
+        '\t' in code,
+        '  ' in code,
+    )
 
 def validate_submission_format(code: str, language: str = "python") -> Dict[str, Any]:
     """
@@ -129,30 +268,21 @@ def validate_submission_format(code: str, language: str = "python") -> Dict[str,
     warnings = []
     
     if language.lower() == "python":
+        is_blank, triple_double, triple_single, trailing_empty_lines, has_tabs, has_spaces = _scan_code_flags(code)
+        
         # Check for basic Python syntax issues
-        if not code.strip():
+        if is_blank:
             issues.append("代码不能为空")
         
         # Check for common issues
-        if code.count('"""') % 2 != 0 or code.count("'''") % 2 != 0:
+        if triple_double % 2 != 0 or triple_single % 2 != 0:
             issues.append("多行字符串引号不匹配")
         
         # Check for excessive whitespace
-        lines = code.split('\n')
-        trailing_empty_lines = 0
-        for line in reversed(lines):
-            if line.strip() == '':
-                trailing_empty_lines += 1
-            else:
-                break
-        
         if trailing_empty_lines > 2:
             warnings.append(f"代码末尾有 {trailing_empty_lines} 行空行，可以优化")
         
         # Check for tabs vs spaces
-        has_tabs = '\t' in code
-        has_spaces = '    ' in code or '  ' in code
-        
         if has_tabs and has_spaces:
             warnings.append("混合使用了制表符和空格，建议统一")
     
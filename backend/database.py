@@ -2,22 +2,106 @@
 Database configuration and session management
 """
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, Session, ORMExecuteState, raiseload
+from typing import AsyncIterator, Iterable
 import os
 
 # Database URL - 将数据库文件放在项目根目录
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///../golfpad.db")
 
+# Async driver for each sync dialect, used by routes on the async engine
+# (asyncpg comes with the `postgresql` extra)
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+def _async_url(url: str) -> str:
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise RuntimeError(
+            f"No default async driver for {backend!r} databases; set ASYNC_DATABASE_URL "
+            f"to an async URL for the same database (e.g. mysql+aiomysql://...)"
+        )
+    return parsed.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _async_url(DATABASE_URL)
+
+# Connection pool sizing; the first DB_POOL_WARM connections are opened at startup.
+# Each engine (sync and async) holds up to DB_POOL_SIZE + DB_MAX_OVERFLOW
+# connections per worker process, which has to fit the server's
+# max_connections when running several workers against PostgreSQL.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "32"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "30"))
+DB_POOL_WARM = int(os.getenv("DB_POOL_WARM", "4"))
+# Server connections can be closed while idle (server timeouts, restarts,
+# proxies); checking them on checkout and recycling them after
+# DB_POOL_RECYCLE seconds avoids failing requests on a dead connection.
+# A local SQLite file never goes away, so the check is off there.
+_IS_SQLITE = make_url(DATABASE_URL).get_backend_name() == "sqlite"
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "0" if _IS_SQLITE else "1") == "1"
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Compiled statements kept per engine (SQLAlchemy's default is 500)
+DB_QUERY_CACHE_SIZE = int(os.getenv("DB_QUERY_CACHE_SIZE", "1200"))
+
+# In debug mode, touching a relationship that a query didn't load raises
+# instead of silently issuing one SELECT per row
+RAISE_ON_LAZY_LOAD = os.getenv("GOLFPAD_DEBUG", "0") == "1"
+
 # Create engine
 engine = create_engine(
     DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
+    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {},
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    pool_recycle=DB_POOL_RECYCLE,
+    query_cache_size=DB_QUERY_CACHE_SIZE
+)
+
+# Engine for async routes and the evaluation worker, so their queries don't
+# block the event loop
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    pool_recycle=DB_POOL_RECYCLE,
+    query_cache_size=DB_QUERY_CACHE_SIZE
+)
+
+# SQLite tuning: WAL lets readers run alongside the writer, and
+# synchronous=NORMAL only fsyncs at checkpoints instead of every commit
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-65536",
 )
 
-# Create session
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine, "connect")
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+        cursor.close()
+
+# Create session. Objects stay loaded after commit: sessions live for a
+# single request, so there is nothing to gain from reloading them.
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(autoflush=False, expire_on_commit=False, bind=async_engine)
+
+if RAISE_ON_LAZY_LOAD:
+    @event.listens_for(Session, "do_orm_execute")
+    def raise_on_lazy_load(execute_state: ORMExecuteState):
+        # Relationships a query loads explicitly (joinedload, selectinload)
+        # take precedence over the wildcard
+        if execute_state.is_select and not execute_state.is_relationship_load:
+            execute_state.statement = execute_state.statement.options(raiseload("*"))
 
 # Base class for models
 Base = declarative_base()
@@ -28,4 +112,34 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def warm_pool(count: int = DB_POOL_WARM) -> None:
+    """Open pooled connections ahead of the first requests"""
+    connections = []
+    try:
+        for _ in range(min(count, DB_POOL_SIZE)):
+            connections.append(engine.connect())
+    finally:
+        for connection in connections:
+            connection.close()
+
+def create_missing_indexes() -> None:
+    """
+    Create indexes declared on existing tables
+    
+    create_all only creates indexes together with their table, so indexes
+    added to the models later are created here.
+    """
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+def bulk_commit(session: Session, items: Iterable) -> None:
+    """Add a batch of new objects and write them in a single transaction"""
+    session.add_all(items)
+    session.commit()
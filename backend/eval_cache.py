@@ -0,0 +1,116 @@
+"""
+Persistent cache of evaluation results
+
+Users often resubmit a solution unchanged (or resubmit after fixing a
+different problem), and evaluating it again gives the same verdict. Results
+are stored in a local SQLite file keyed by a digest of everything that
+decides the outcome: the wrapped source, the language toolchain and the
+test cases.
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import orjson
+
+from backend.schemas import EvaluationResult
+
+logger = logging.getLogger(__name__)
+
+EVAL_CACHE_ENABLED = os.getenv("GOLFPAD_EVAL_CACHE", "1") == "1"
+EVAL_CACHE_PATH = os.path.join(
+    os.getenv("GOLFPAD_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "golfpad")),
+    "evaluations.sqlite3"
+)
+# Oldest results are dropped once the cache holds more than this many
+EVAL_CACHE_MAX_ENTRIES = int(os.getenv("GOLFPAD_EVAL_CACHE_ENTRIES", "20000"))
+# Eviction runs once per this many writes rather than on every one, so the
+# cache can briefly hold up to this many entries over the limit
+EVAL_CACHE_TRIM_EVERY = int(os.getenv("GOLFPAD_EVAL_CACHE_TRIM_EVERY", "100"))
+
+_connection: Optional[sqlite3.Connection] = None
+_lock = threading.Lock()
+_puts_since_trim = 0
+
+def _connect() -> sqlite3.Connection:
+    global _connection
+    if _connection is None:
+        os.makedirs(os.path.dirname(EVAL_CACHE_PATH), exist_ok=True)
+        connection = sqlite3.connect(EVAL_CACHE_PATH, check_same_thread=False, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, created_at INTEGER NOT NULL)"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS ix_results_created_at ON results (created_at)")
+        _connection = connection
+    return _connection
+
+def evaluation_key(wrapped_code: str, language: str, config_id: str, test_cases: Dict[str, Any]) -> str:
+    """
+    Digest identifying one evaluation
+    
+    config_id stands for the language configuration (toolchain and time
+    limit), so changing either invalidates earlier results.
+    """
+    digest = hashlib.sha256()
+    for part in (language.encode(), config_id.encode(), wrapped_code.encode('utf-8', 'surrogatepass')):
+        digest.update(part)
+        digest.update(b'|')
+    digest.update(orjson.dumps(test_cases, option=orjson.OPT_SORT_KEYS))
+    return digest.hexdigest()
+
+def get(key: str) -> Optional[EvaluationResult]:
+    """
+    Return the cached result for key, or None
+    
+    Blocking; call it from a worker thread (asyncio.to_thread) in async code.
+    """
+    if not EVAL_CACHE_ENABLED:
+        return None
+    try:
+        with _lock:
+            row = _connect().execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+    except sqlite3.Error as e:
+        logger.warning("⚠️ Evaluation cache read failed: %s", e)
+        return None
+    if row is None:
+        return None
+    return EvaluationResult(**orjson.loads(row[0]))
+
+def put(key: str, result: EvaluationResult):
+    """
+    Store a result, evicting the oldest entries beyond EVAL_CACHE_MAX_ENTRIES
+    
+    Blocking, like get.
+    """
+    global _puts_since_trim
+    if not EVAL_CACHE_ENABLED:
+        return
+    try:
+        value = orjson.dumps(result.model_dump())
+    except orjson.JSONEncodeError:
+        # e.g. a parsed output that isn't JSON-compatible; just don't cache it
+        return
+    try:
+        with _lock:
+            connection = _connect()
+            connection.execute(
+                "INSERT OR REPLACE INTO results (key, value, created_at) VALUES (?, ?, ?)",
+                (key, value, int(time.time()))
+            )
+            _puts_since_trim += 1
+            if _puts_since_trim >= EVAL_CACHE_TRIM_EVERY:
+                _puts_since_trim = 0
+                connection.execute(
+                    "DELETE FROM results WHERE key IN ("
+                    "SELECT key FROM results ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                    (EVAL_CACHE_MAX_ENTRIES,)
+                )
+    except sqlite3.Error as e:
+        logger.warning("⚠️ Evaluation cache write failed: %s", e)
@@ -3,32 +3,58 @@ Code evaluation system for different programming languages
 """
 
 import asyncio
+import contextlib
+import hashlib
+import logging
+import shutil
 import subprocess
 import tempfile
 import os
-import json
 import time
+import math
 import resource
-from typing import Dict, Any, List
+import orjson
+from dataclasses import dataclass
+from typing import Callable, Dict, Any, List, Optional, Tuple
 from backend.schemas import EvaluationResult
+from backend import eval_cache
+from backend.evaluation_pool import PythonWorkerPool
+
+logger = logging.getLogger(__name__)
+
+# Include the wrapper's diagnostic messages in program stderr (and so in failure details)
+WRAPPER_DEBUG = os.getenv("GOLFPAD_DEBUG", "0") == "1"
 
 # Supported languages and their configurations
 LANGUAGE_CONFIG = {
     "python": {
         "extension": ".py",
         "command": ["python3"],
-        "timeout": 10
+        "timeout": 10,
+        # Wrapper streams newline-delimited JSON inputs, so all test cases
+        # run through a single interpreter process
+        "batch": True,
+        # Batches run in pre-started interpreters from PYTHON_POOL
+        "worker_pool": True,
+        # Source can be passed as an argument instead of a file
+        "inline_flag": "-c",
+        # Address space limit for solutions (see set_process_limits)
+        "memory_limit_mb": 256
     },
     "javascript": {
         "extension": ".js",
         "command": ["node"],
-        "timeout": 10
+        "timeout": 10,
+        "inline_flag": "-e"
+        # No memory_limit_mb: V8, the JVM and the Go runtime reserve large
+        # address ranges up front and fail to start under RLIMIT_AS
     },
     "cpp": {
         "extension": ".cpp",
         "compile_command": ["g++", "-o", "{output}", "{source}", "-std=c++17"],
         "run_command": ["{output}"],
-        "timeout": 10
+        "timeout": 10,
+        "memory_limit_mb": 256
     },
     "java": {
         "extension": ".java",
@@ -45,84 +71,325 @@ LANGUAGE_CONFIG = {
         "extension": ".rs",
         "compile_command": ["rustc", "{source}", "-o", "{output}"],
         "run_command": ["{output}"],
-        "timeout": 15
+        "timeout": 15,
+        "memory_limit_mb": 256
     }
 }
 
-def wrap_user_code(code: str, language: str) -> str:
+def make_argv_builder(template: List[str]) -> Callable[..., List[str]]:
     """
-    Wrap user code with test execution logic
+    Pre-parse an argv template such as ["g++", "-o", "{output}", "{source}"]
+    
+    Literal parts are kept as-is and only parts containing a placeholder
+    are formatted, so expanding the template is a single list build.
     """
-    print(f"🔧 Wrapping user code for language: {language}")
-    print(f"📝 Original code length: {len(code)} characters")
+    parts = [(part, "{" in part) for part in template]
     
-    if language == "python":
-        wrapped = f"""
+    def build(**values: str) -> List[str]:
+        return [part.format_map(values) if templated else part for part, templated in parts]
+    
+    return build
+
+def resolve_language_tools(config: Dict) -> List[str]:
+    """
+    Replace each command's program name with its absolute path
+    
+    Resolving once at import spares a PATH search on every spawn.
+    Returns the names of programs that could not be found.
+    """
+    missing = []
+    for key in ("command", "compile_command", "run_command"):
+        if key not in config or "{" in config[key][0]:
+            continue
+        path = shutil.which(config[key][0])
+        if path:
+            config[key] = [path] + config[key][1:]
+        else:
+            missing.append(config[key][0])
+    return missing
+
+@dataclass(frozen=True, slots=True)
+class LangCfg:
+    """Resolved, read-only form of a LANGUAGE_CONFIG entry used by the evaluator"""
+    extension: str
+    timeout: int
+    # argv builders taking source=, output=, dir=, classname=
+    spawn: Callable[..., List[str]]
+    compile: Optional[Callable[..., List[str]]]
+    # argv builder taking code=, for running source without a file
+    spawn_inline: Optional[Callable[..., List[str]]]
+    # Whether all test cases can run through one process
+    batch: bool
+    # Whether the build output is a single executable that can be cached
+    cacheable: bool
+    # Whether batches run in the pre-started interpreter pool
+    pooled: bool
+    # RLIMIT_AS for solution processes in bytes, or None for no limit
+    memory_limit: Optional[int]
+    missing_tools: Tuple[str, ...]
+    # Identifies the compiler build and flags, for compile cache keys
+    toolchain_id: str
+
+def toolchain_fingerprint(config: Dict) -> str:
+    """
+    Hash of a language's compile command and the compiler binary's identity
+    
+    Uses the compiler's path, size and mtime rather than running
+    `--version`, so upgrading the toolchain or changing flags invalidates
+    cached executables without spawning anything at import.
+    """
+    command = config.get("compile_command", [])
+    fingerprint = hashlib.sha256(orjson.dumps(command))
+    if command:
+        try:
+            st = os.stat(command[0])
+            fingerprint.update(f"{st.st_size}:{st.st_mtime_ns}".encode())
+        except OSError:
+            pass
+    return fingerprint.hexdigest()
+
+def build_lang_cfg(config: Dict) -> LangCfg:
+    """
+    Resolve a LANGUAGE_CONFIG entry into a LangCfg
+    """
+    missing_tools = tuple(resolve_language_tools(config))
+    spawn_inline = None
+    if "compile_command" in config:
+        # Compiled language: run the built executable
+        compile_argv = make_argv_builder(config["compile_command"])
+        spawn = make_argv_builder(config.get("run_command", ["{output}"]))
+        cacheable = any("{output}" in part for part in config["compile_command"])
+    else:
+        # Interpreted language: pass the source file to the interpreter
+        compile_argv = None
+        spawn = make_argv_builder(config["command"] + ["{source}"])
+        cacheable = False
+        if "inline_flag" in config:
+            spawn_inline = make_argv_builder(config["command"] + [config["inline_flag"], "{code}"])
+    return LangCfg(
+        extension=config["extension"],
+        timeout=config["timeout"],
+        spawn=spawn,
+        compile=compile_argv,
+        spawn_inline=spawn_inline,
+        batch=config.get("batch", False),
+        cacheable=cacheable,
+        pooled=config.get("worker_pool", False),
+        memory_limit=config["memory_limit_mb"] * 1024 * 1024 if "memory_limit_mb" in config else None,
+        missing_tools=missing_tools,
+        toolchain_id=toolchain_fingerprint(config)
+    )
+
+LANG: Dict[str, LangCfg] = {
+    language: build_lang_cfg(config) for language, config in LANGUAGE_CONFIG.items()
+}
+
+# Pre-started Python interpreters, one per CPU. Each runs a single job by
+# default (GOLFPAD_WORKER_MAX_JOBS raises that, trading away isolation).
+PYTHON_POOL_ENABLED = os.getenv("GOLFPAD_PYTHON_POOL", "1") == "1"
+PYTHON_POOL = PythonWorkerPool(
+    LANGUAGE_CONFIG["python"]["command"],
+    size=os.cpu_count() or 1,
+    max_jobs=int(os.getenv("GOLFPAD_WORKER_MAX_JOBS", "1")),
+    prepare=lambda pid: set_process_limits(pid, memory_limit=LANG["python"].memory_limit)
+)
+
+# Larger sources are written to a file; a single argv entry is capped at 128KB on Linux
+INLINE_SOURCE_MAX_BYTES = 96 * 1024
+
+# User code containing any of these is not run in batch mode (see reads_stdin)
+STDIN_MARKERS = ("input(", "stdin")
+
+# Failures with these errors depend on server load rather than on the code
+TRANSIENT_ERRORS = ("Execution timeout", "Worker ")
+
+# Batched runs are split across CPUs, but never into shards smaller than this
+BATCH_MIN_SHARD_CASES = 32
+
+# Compiled executables are cached by content so identical resubmissions skip the compiler
+COMPILE_CACHE_DIR = os.path.join(
+    os.getenv("GOLFPAD_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "golfpad")),
+    "bin"
+)
+# Least recently used executables are removed once the cache exceeds this size
+COMPILE_CACHE_MAX_BYTES = int(os.getenv("GOLFPAD_COMPILE_CACHE_MB", "512")) * 1024 * 1024
+
+def compiled_cache_path(wrapped_code: str, language: str, cfg: LangCfg) -> Optional[str]:
+    """
+    Cache location for a compiled executable
+    
+    The key covers the source, the compile flags and the compiler build.
+    Returns None when the language's build output is not a single
+    executable file (e.g. Java class files).
+    """
+    if not cfg.cacheable:
+        return None
+    digest = hashlib.sha256(cfg.toolchain_id.encode())
+    digest.update(wrapped_code.encode('utf-8', 'surrogatepass'))
+    return os.path.join(COMPILE_CACHE_DIR, language, digest.hexdigest())
+
+def trim_compile_cache(max_bytes: int = COMPILE_CACHE_MAX_BYTES):
+    """
+    Delete the least recently used executables until the cache fits max_bytes
+    """
+    entries = []
+    total = 0
+    try:
+        for language_dir in os.scandir(COMPILE_CACHE_DIR):
+            if not language_dir.is_dir():
+                continue
+            for entry in os.scandir(language_dir.path):
+                st = entry.stat()
+                entries.append((st.st_mtime_ns, st.st_size, entry.path))
+                total += st.st_size
+    except OSError as e:
+        logger.warning("⚠️ Could not scan compile cache: %s", e)
+        return
+    
+    entries.sort()
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except FileNotFoundError:
+            total -= size
+        except OSError as e:
+            logger.warning("⚠️ Could not evict %s: %s", path, e)
+
+def store_compiled_executable(executable: str, cache_path: str) -> str:
+    """
+    Copy a freshly built executable into the compile cache
+    
+    Returns the path to run from: the cached copy, or the original
+    executable if the cache is not writable.
+    """
+    cache_dir = os.path.dirname(cache_path)
+    tmp_path = None
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Copy then rename so concurrent readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir)
+        os.close(fd)
+        shutil.copy2(executable, tmp_path)
+        os.replace(tmp_path, cache_path)
+        trim_compile_cache()
+        return cache_path
+    except OSError as e:
+        logger.warning("⚠️ Could not cache executable: %s", e)
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return executable
+
+def touch_cached_executable(cache_path: str) -> bool:
+    """
+    Check for a cached executable, refreshing its mtime on a hit
+    
+    The mtime records last use so old entries can be trimmed.
+    """
+    try:
+        os.utime(cache_path)
+        return True
+    except FileNotFoundError:
+        return False
+
+# The Python wrapper is fixed text around the user's code, built once at import
+PYTHON_WRAPPER_PREFIX = """
 import json
 import sys
 
 # User's code
-{code}
+USER_SOURCE = """
 
+PYTHON_WRAPPER_SUFFIX = f"""
 # Test execution wrapper
 if __name__ == "__main__":
-    try:
-        # Read input from stdin
-        input_data = sys.stdin.read().strip()
-        print(f"📥 Received input data: {{input_data}}", file=sys.stderr)
-        
-        if input_data:
-            test_input = json.loads(input_data)
-            print(f"✅ Parsed input as JSON: {{test_input}}", file=sys.stderr)
-        else:
-            test_input = None
-            print("ℹ️ No input data provided", file=sys.stderr)
-        
-        # Find the main function (assume it's the first function defined)
-        import inspect
-        import types
-        
-        # Get all functions from the current module
-        current_module = sys.modules[__name__]
-        functions = []
-        for name, obj in inspect.getmembers(current_module):
-            if inspect.isfunction(obj) and not name.startswith('_'):
-                functions.append((name, obj))
+    # Each stdin line is one JSON test input; each stdout line is the
+    # JSON result for the matching input, in order
+    results_out = sys.stdout
+    # Keep stray prints in user code from desynchronising the result stream
+    sys.stdout = sys.stderr
+    
+    from types import FunctionType
+    
+    # Compiled once and executed afresh for every test case, so state a
+    # solution keeps in globals or default arguments can't carry over
+    # from one case to the next
+    user_code = compile(USER_SOURCE, "<solution>", "exec")
+    
+    def load_solution():
+        # json and sys have always been in scope for user code
+        namespace = {{"__name__": "__main__", "json": json, "sys": sys}}
+        exec(user_code, namespace)
+        return namespace
+    
+    namespace = load_solution()
+    
+    # Find the main function: golf solutions conventionally define p,
+    # otherwise use the first public function in name order
+    func_name = "p"
+    if not isinstance(namespace.get(func_name), FunctionType):
+        functions = sorted(
+            name for name, obj in namespace.items()
+            if isinstance(obj, FunctionType) and not name.startswith('_')
+        )
         
-        print(f"🔍 Found {{len(functions)}} functions: {{[f[0] for f in functions]}}", file=sys.stderr)
+        if {WRAPPER_DEBUG}:
+            print(f"🔍 Found {{len(functions)}} functions: {{functions}}", file=sys.stderr)
         
         if not functions:
             print("❌ No function found in code", file=sys.stderr)
-            print(json.dumps({{"error": "No function found in code"}}))
             sys.exit(1)
         
-        # Use the first function found
-        func_name, func = functions[0]
+        func_name = functions[0]
+    
+    if {WRAPPER_DEBUG}:
         print(f"🎯 Using function: {{func_name}}", file=sys.stderr)
+    
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            test_input = json.loads(line)
+            
+            if namespace is None:
+                namespace = load_solution()
+            func = namespace[func_name]
+            
+            # Call the function with test input
+            if test_input is not None:
+                result = func(test_input)
+            else:
+                result = func()
+            namespace = None
+            
+            # Output result as JSON
+            # Compact separators match the grader's canonical form
+            print(json.dumps(result, separators=(',', ':')), file=results_out, flush=True)
         
-        # Call the function with test input
-        if test_input is not None:
-            print(f"📋 Calling {{func_name}} with single arg: {{test_input}}", file=sys.stderr)
-            result = func(test_input)
-        else:
-            print(f"📋 Calling {{func_name}} with no args", file=sys.stderr)
-            result = func()
-        
-        print(f"✅ Function returned: {{result}}", file=sys.stderr)
-        
-        # Output result as JSON
-        print(json.dumps(result))
-        
-    except Exception as e:
-        print(f"❌ Exception occurred: {{str(e)}}", file=sys.stderr)
-        print(json.dumps({{"error": str(e)}}))
-        sys.exit(1)
+        except Exception as e:
+            # The failing case is the first input without a result line
+            print(f"❌ Exception occurred: {{str(e)}}", file=sys.stderr)
+            sys.exit(1)
 """
-        print(f"✅ Wrapped code length: {len(wrapped)} characters")
+
+def wrap_user_code(code: str, language: str) -> str:
+    """
+    Wrap user code with test execution logic
+    """
+    logger.debug("🔧 Wrapping user code for language: %s", language)
+    logger.debug("📝 Original code length: %s characters", len(code))
+    
+    if language == "python":
+        # Embedded as a string literal; the wrapper compiles it itself
+        wrapped = PYTHON_WRAPPER_PREFIX + repr(code) + "\n" + PYTHON_WRAPPER_SUFFIX
+        logger.debug("✅ Wrapped code length: %s characters", len(wrapped))
         return wrapped
     else:
         # For other languages, return code as-is for now
-        print(f"⚠️ Language {language} not yet supported for wrapping, returning original code")
+        logger.debug("⚠️ Language %s not yet supported for wrapping, returning original code", language)
         return code
 
 
@@ -130,190 +397,439 @@ async def evaluate_code(code: str, language: str, test_cases: Dict[str, Any]) ->
     """
     Evaluate code against test cases
     """
-    print(f"\n🚀 Starting code evaluation")
-    print(f"📝 Language: {language}")
-    print(f"📊 Test cases keys: {list(test_cases.keys())}")
-    print(f"💻 Code preview: {code[:100]}...")
+    logger.debug("🚀 Starting code evaluation")
+    logger.debug("📝 Language: %s", language)
+    logger.debug("📊 Test cases keys: %s", test_cases.keys())
+    logger.debug("💻 Code preview: %.100s...", code)
     
     if language not in LANGUAGE_CONFIG:
-        print(f"❌ Unsupported language: {language}")
+        logger.debug("❌ Unsupported language: %s", language)
         return EvaluationResult(
             status="error",
             test_results=[],
             error_message=f"Unsupported language: {language}"
         )
     
-    config = LANGUAGE_CONFIG[language]
-    print(f"⚙️ Using config: {config}")
+    cfg = LANG[language]
+    logger.debug("⚙️ Using config: %s", LANGUAGE_CONFIG[language])
+    
+    if cfg.missing_tools:
+        logger.debug("❌ Missing tools for %s: %s", language, cfg.missing_tools)
+        return EvaluationResult(
+            status="error",
+            test_results=[],
+            error_message=f"Language {language} is not available on this server: missing {', '.join(cfg.missing_tools)}"
+        )
     
     try:
-        # Create temporary directory for execution
-        with tempfile.TemporaryDirectory() as temp_dir:
-            print(f"📁 Created temp directory: {temp_dir}")
+        # Wrap user code with test execution logic
+        wrapped_code = wrap_user_code(code, language)
+        
+        # Identical resubmissions get the stored verdict without running anything
+        cache_key = eval_cache.evaluation_key(
+            wrapped_code, language, f"{cfg.toolchain_id}:{cfg.timeout}:{cfg.memory_limit}", test_cases
+        )
+        cached = await asyncio.to_thread(eval_cache.get, cache_key)
+        if cached is not None:
+            logger.debug("♻️ Reusing cached evaluation result")
+            return cached
+        
+        result = await run_evaluation(code, wrapped_code, language, cfg, test_cases)
+        if is_repeatable(result):
+            await asyncio.to_thread(eval_cache.put, cache_key, result)
+        return result
             
-            # Wrap user code with test execution logic
-            wrapped_code = wrap_user_code(code, language)
+    except Exception as e:
+        logger.error("❌ Evaluation error: %s", e)
+        return EvaluationResult(
+            status="error",
+            test_results=[],
+            error_message=str(e)
+        )
+
+def is_repeatable(result: EvaluationResult) -> bool:
+    """
+    Whether running the same evaluation again would give the same result
+    
+    Timeouts, lost workers and internal errors depend on server load, so
+    those results are not cached.
+    """
+    if result.status == "passed":
+        return True
+    if result.status != "failed":
+        return False
+    return all(
+        test_result.get("status") == "failed"
+        and not str(test_result.get("error", "")).startswith(TRANSIENT_ERRORS)
+        for test_result in result.test_results
+    )
+
+async def run_evaluation(code: str, wrapped_code: str, language: str, cfg: LangCfg, test_cases: Dict[str, Any]) -> EvaluationResult:
+    """
+    Uncached implementation of evaluate_code
+    """
+    # Interpreters that take source as an argument don't need a file
+    inline = (
+        cfg.spawn_inline is not None
+        and len(wrapped_code.encode('utf-8', 'surrogatepass')) <= INLINE_SOURCE_MAX_BYTES
+    )
+    
+    # Create temporary directory for execution
+    with contextlib.nullcontext() if inline else tempfile.TemporaryDirectory() as temp_dir:
+        source_file = None
+        if not inline:
+            logger.debug("📁 Created temp directory: %s", temp_dir)
             
             # Write wrapped code to file
-            source_file = os.path.join(temp_dir, f"solution{config['extension']}")
+            source_file = os.path.join(temp_dir, f"solution{cfg.extension}")
             with open(source_file, 'w', encoding='utf-8') as f:
                 f.write(wrapped_code)
-            print(f"💾 Wrote code to: {source_file}")
-            
-            # Compile if necessary
-            executable = None
-            if "compile_command" in config:
-                print(f"🔨 Compiling code...")
-                executable = os.path.join(temp_dir, "solution")
-                compile_cmd = []
-                for part in config["compile_command"]:
-                    if "{source}" in part:
-                        compile_cmd.append(part.replace("{source}", source_file))
-                    elif "{output}" in part:
-                        compile_cmd.append(part.replace("{output}", executable))
-                    elif "{dir}" in part:
-                        compile_cmd.append(part.replace("{dir}", temp_dir))
-                    else:
-                        compile_cmd.append(part)
-                
-                print(f"🔨 Compile command: {' '.join(compile_cmd)}")
-                
-                # Compile
-                compile_result = await run_command(compile_cmd, timeout=30)
-                if compile_result["returncode"] != 0:
-                    print(f"❌ Compilation failed: {compile_result['stderr']}")
-                    return EvaluationResult(
-                        status="error",
-                        test_results=[],
-                        error_message=f"Compilation failed: {compile_result['stderr']}"
-                    )
-                print(f"✅ Compilation successful")
+            logger.debug("💾 Wrote code to: %s", source_file)
+        
+        # Compile if necessary
+        executable = None
+        if cfg.compile is not None:
+            cache_path = compiled_cache_path(wrapped_code, language, cfg)
+            if cache_path and touch_cached_executable(cache_path):
+                logger.debug("♻️ Reusing cached executable: %s", cache_path)
+                executable = cache_path
+        
+        if cfg.compile is not None and executable is None:
+            logger.debug("🔨 Compiling code...")
+            executable = os.path.join(temp_dir, "solution")
+            compile_cmd = cfg.compile(
+                source=source_file, output=executable, dir=temp_dir
+            )
             
-            # Run tests
-            test_results = []
-            total_time = 0
-            max_memory = 0
-            passed_total = 0
+            logger.debug("🔨 Compile command: %s", compile_cmd)
             
-            # 遍历所有类型的测试用例（train, test, arc-gen等）
-            for test_type, test_case_list in test_cases.items():
-                if not isinstance(test_case_list, list):
-                    print(f"⚠️ Skipping {test_type}: not a list of test cases")
-                    continue
-                    
-                print(f"🏃 Running {len(test_case_list)} {test_type} test cases...")
-                
-                for i, test_case in enumerate(test_case_list):
-                    print(f"🧪 Running {test_type} test case {i}: {test_case}")
-                    result = await run_test_case(
-                        source_file, executable, config, test_case, f"{test_type}_{i}"
-                    )
-                    print(f"📊 Test result: {result}")
-                    
-                    if result["status"] != "passed":
-                        print(f"❌ {test_type} test case {i} failed, stopping evaluation")
-                        # 在失败时保留详细的失败结果，便于排查
-                        test_results.append(result)
-                        return EvaluationResult(
-                            status="failed",
-                            test_results=test_results,
-                            execution_time=total_time,
-                            memory_usage=max_memory
-                        )
-                    
-                    total_time += result.get("execution_time", 0)
-                    max_memory = max(max_memory, result.get("memory_usage", 0))
-                    passed_total += 1
-                
-                print(f"✅ All {test_type} test cases passed")
+            # Compile
+            compile_result = await run_command(compile_cmd, timeout=30)
+            if compile_result["returncode"] != 0:
+                compile_errors = decode_output(compile_result['stderr'])
+                logger.debug("❌ Compilation failed: %s", compile_errors)
+                return EvaluationResult(
+                    status="error",
+                    test_results=[],
+                    error_message=f"Compilation failed: {compile_errors}"
+                )
+            logger.debug("✅ Compilation successful")
             
-            print(f"🎉 Evaluation completed successfully!")
-            print(f"⏱️ Total execution time: {total_time:.3f}s")
-            print(f"💾 Max memory usage: {max_memory} bytes")
+            if cache_path:
+                executable = store_compiled_executable(executable, cache_path)
+        
+        # Run tests
+        # 遍历所有类型的测试用例（train, test, arc-gen等）
+        named_cases = []
+        for test_type, test_case_list in test_cases.items():
+            if not isinstance(test_case_list, list):
+                logger.debug("⚠️ Skipping %s: not a list of test cases", test_type)
+                continue
             
-            # 通过时仅返回“通过”二字，避免出现 summary 或分隔符
+            logger.debug("🏃 Queueing %s %s test cases...", len(test_case_list), test_type)
+            for i, test_case in enumerate(test_case_list):
+                named_cases.append((f"{test_type}_{i}", test_case))
+        
+        # The run argv is the same for every test case, so build it once
+        if inline:
+            run_argv = cfg.spawn_inline(code=wrapped_code)
+        else:
+            run_argv = build_run_command(source_file, executable, cfg)
+        logger.debug("🚀 Command: %s", run_argv)
+        
+        if cfg.batch and not reads_stdin(code):
+            failure, total_time, max_memory = await run_test_batch(
+                wrapped_code, run_argv, cfg, named_cases
+            )
+        else:
+            failure, total_time, max_memory = await run_test_concurrently(
+                run_argv, cfg, named_cases
+            )
+        
+        if failure is not None:
+            logger.debug("❌ Test case %s failed, stopping evaluation", failure['test_name'])
+            # 在失败时保留详细的失败结果，便于排查
             return EvaluationResult(
-                status="passed",
-                test_results=[{"message": "通过"}],
+                status="failed",
+                test_results=[failure],
                 execution_time=total_time,
                 memory_usage=max_memory
             )
-            
-    except Exception as e:
-        print(f"❌ Evaluation error: {str(e)}")
+        
+        logger.debug("🎉 Evaluation completed successfully!")
+        logger.debug("⏱️ Total execution time: %.3fs", total_time)
+        logger.debug("💾 Max memory usage: %s bytes", max_memory)
+        
+        # 通过时仅返回“通过”二字，避免出现 summary 或分隔符
         return EvaluationResult(
-            status="error",
-            test_results=[],
-            error_message=str(e)
+            status="passed",
+            test_results=[{"message": "通过"}],
+            execution_time=total_time,
+            memory_usage=max_memory
         )
 
-async def run_test_case(source_file: str, executable: str, config: Dict, test_case: Dict, test_name: str) -> Dict[str, Any]:
+async def run_test_concurrently(run_argv: List[str], cfg: LangCfg, named_cases: List[Tuple[str, Dict]]) -> Tuple[Optional[Dict[str, Any]], float, int]:
+    """
+    Run test cases in separate processes concurrently, stopping at the first failure
+    
+    At most one process per CPU runs at a time. As soon as any case fails,
+    the remaining cases are cancelled and their processes killed.
+    
+    Returns (failed test result or None, total execution time, max memory usage)
+    """
+    # Accumulated as integer nanoseconds and converted once at the end
+    total_ns = 0
+    max_memory = 0
+    semaphore = asyncio.Semaphore(os.cpu_count() or 1)
+    
+    async def run_limited(test_name: str, test_case: Dict) -> Tuple[Dict[str, Any], int]:
+        async with semaphore:
+            start_ns = time.perf_counter_ns()
+            result = await run_test_case(run_argv, cfg, test_case, test_name)
+            return result, time.perf_counter_ns() - start_ns
+    
+    tasks = [
+        asyncio.create_task(run_limited(test_name, test_case))
+        for test_name, test_case in named_cases
+    ]
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                result, elapsed_ns = task.result()
+                logger.debug("📊 Test result: %s", result)
+                
+                if result["status"] != "passed":
+                    return result, total_ns / 1e9, max_memory
+                
+                total_ns += elapsed_ns
+                max_memory = max(max_memory, result.get("memory_usage", 0))
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    
+    return None, total_ns / 1e9, max_memory
+
+async def run_test_batch(source: str, run_argv: List[str], cfg: LangCfg, named_cases: List[Tuple[str, Dict]]) -> Tuple[Optional[Dict[str, Any]], float, int]:
+    """
+    Run test cases through a few long-lived processes in parallel
+    
+    Cases are split into contiguous shards, at most one per CPU and never
+    smaller than BATCH_MIN_SHARD_CASES, so small problems still use a single
+    process. As soon as any shard reports a failure the others are
+    cancelled and their processes killed.
+    
+    Returns (failed test result or None, total execution time, max memory usage)
+    """
+    if not named_cases:
+        return None, 0, 0
+    
+    shard_count = max(1, min(os.cpu_count() or 1, len(named_cases) // BATCH_MIN_SHARD_CASES))
+    shard_size = -(-len(named_cases) // shard_count)
+    shards = [named_cases[i:i + shard_size] for i in range(0, len(named_cases), shard_size)]
+    logger.debug("🧪 Running %s test cases in %s batch(es)", len(named_cases), len(shards))
+    
+    total_time = 0
+    max_memory = 0
+    tasks = [
+        asyncio.create_task(run_batch_shard(source, run_argv, cfg, shard))
+        for shard in shards
+    ]
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                failure, execution_time, memory_usage = task.result()
+                if failure is not None:
+                    return failure, total_time + execution_time, max(max_memory, memory_usage)
+                total_time += execution_time
+                max_memory = max(max_memory, memory_usage)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    
+    return None, total_time, max_memory
+
+async def run_batch_shard(source: str, run_argv: List[str], cfg: LangCfg, named_cases: List[Tuple[str, Dict]]) -> Tuple[Optional[Dict[str, Any]], float, int]:
+    """
+    Run a list of test cases through a single process
+    
+    Inputs are written as newline-delimited JSON and the program answers
+    with one JSON line per input, so interpreter startup is paid once per
+    shard instead of once per test case. Each answer must arrive within
+    the per-case time limit of the previous one; the shard as a whole is
+    capped at that limit times the number of cases.
+    
+    Returns (failed test result or None, execution time, memory usage)
+    """
+    input_data = b"\n".join(orjson.dumps(test_case["input"]) for _, test_case in named_cases) + b"\n"
+    
+    start_ns = time.perf_counter_ns()
+    if cfg.pooled and PYTHON_POOL_ENABLED:
+        result = await PYTHON_POOL.run(
+            source,
+            input_data,
+            timeout=cfg.timeout * len(named_cases),
+            idle_timeout=cfg.timeout
+        )
+    else:
+        result = await run_command(
+            run_argv,
+            input_data=input_data,
+            timeout=cfg.timeout * len(named_cases),
+            memory_limit=cfg.memory_limit,
+            idle_timeout=cfg.timeout
+        )
+    execution_time = (time.perf_counter_ns() - start_ns) / 1e9
+    memory_usage = result.get("memory_usage", 0)
+    
+    logger.debug("⏱️ Batch execution time: %.3fs", execution_time)
+    logger.debug("🔢 Return code: %s", result['returncode'])
+    
+    outputs = result["stdout"].splitlines()
+    for index, (test_name, test_case) in enumerate(named_cases):
+        if index >= len(outputs):
+            # The process stopped before answering this case
+            logger.debug("❌ No output for %s, return code %s", test_name, result['returncode'])
+            return {
+                "test_name": test_name,
+                "status": "failed",
+                "error": decode_output(result["stderr"]) if result["returncode"] != 0 else "No output produced",
+                "execution_time": execution_time
+            }, execution_time, memory_usage
+        
+        check = check_output(
+            test_name, outputs[index], test_case["output"],
+            execution_time, memory_usage, canonical_output(test_case["output"])
+        )
+        if check["status"] != "passed":
+            return check, execution_time, memory_usage
+    
+    return None, execution_time, memory_usage
+
+def reads_stdin(code: str) -> bool:
+    """
+    Heuristic for user code that reads stdin itself
+    
+    Such code would consume the batched inputs meant for the wrapper, so
+    it is run with one process (and one input) per test case instead.
+    """
+    return any(marker in code for marker in STDIN_MARKERS)
+
+def build_run_command(source_file: str, executable: str, cfg: LangCfg) -> List[str]:
+    """
+    Build the argv used to run a prepared solution
+    """
+    return cfg.spawn(
+        source=source_file,
+        output=executable,
+        dir=os.path.dirname(source_file),
+        classname="solution"  # For Java
+    )
+
+async def run_test_case(run_argv: List[str], cfg: LangCfg, test_case: Dict, test_name: str) -> Dict[str, Any]:
     """
     Run a single test case
     """
-    print(f"\n🧪 Running test case: {test_name}")
+    logger.debug("🧪 Running test case: %s", test_name)
     
     try:
         # Prepare input
-        input_data = json.dumps(test_case["input"])
+        input_data = orjson.dumps(test_case["input"])
         expected_output = test_case["output"]
-        print(f"📥 Input data: {input_data}")
-        print(f"🎯 Expected output: {expected_output}")
-        
-        # Prepare command
-        if executable:
-            print(f"🔧 Using executable: {executable}")
-            # Compiled language
-            if "run_command" in config:
-                cmd = []
-                for part in config["run_command"]:
-                    if "{output}" in part:
-                        cmd.append(part.replace("{output}", executable))
-                    elif "{dir}" in part:
-                        cmd.append(part.replace("{dir}", os.path.dirname(source_file)))
-                    elif "{classname}" in part:
-                        # For Java
-                        cmd.append("solution")
-                    else:
-                        cmd.append(part)
-            else:
-                cmd = [executable]
-        else:
-            # Interpreted language
-            cmd = config["command"] + [source_file]
-        
-        print(f"🚀 Command: {' '.join(cmd)}")
+        logger.debug("📥 Input data: %.200s", input_data)
+        logger.debug("🎯 Expected output: %s", expected_output)
         
         # Run the code
-        start_time = time.time()
+        start_ns = time.perf_counter_ns()
         result = await run_command(
-            cmd,
+            run_argv,
             input_data=input_data,
-            timeout=config["timeout"]
+            timeout=cfg.timeout,
+            memory_limit=cfg.memory_limit
         )
-        execution_time = time.time() - start_time
+        execution_time = (time.perf_counter_ns() - start_ns) / 1e9
         
-        print(f"⏱️ Execution time: {execution_time:.3f}s")
-        print(f"🔢 Return code: {result['returncode']}")
-        print(f"📤 Stdout: {result['stdout'][:200]}...")
-        print(f"📤 Stderr: {result['stderr'][:200]}...")
+        logger.debug("⏱️ Execution time: %.3fs", execution_time)
+        logger.debug("🔢 Return code: %s", result['returncode'])
+        logger.debug("📤 Stdout: %.200s...", result['stdout'])
+        logger.debug("📤 Stderr: %.200s...", result['stderr'])
         
         if result["returncode"] != 0:
-            print(f"❌ Command failed with return code {result['returncode']}")
+            logger.debug("❌ Command failed with return code %s", result['returncode'])
             return {
                 "test_name": test_name,
                 "status": "failed",
-                "error": result["stderr"],
+                "error": decode_output(result["stderr"]),
                 "execution_time": execution_time
             }
         
-        # Parse output
+        return check_output(
+            test_name, result["stdout"], expected_output,
+            execution_time, result.get("memory_usage", 0),
+            canonical_output(expected_output)
+        )
+            
+    except Exception as e:
+        logger.error("❌ Test case error: %s", e)
+        return {
+            "test_name": test_name,
+            "status": "error",
+            "error": str(e)
+        }
+
+def canonical_output(expected_output: Any) -> Optional[bytes]:
+    """
+    Canonical (compact JSON) bytes of an expected output
+    
+    Returns None if the value can't be serialized, in which case the
+    output is always compared structurally.
+    """
+    try:
+        return orjson.dumps(expected_output)
+    except orjson.JSONEncodeError:
+        return None
+
+def decode_output(data: bytes) -> str:
+    """
+    Decode raw process output for parsing or for an error message
+    """
+    return data.decode('utf-8', errors='replace')
+
+def check_output(test_name: str, stdout: bytes, expected_output: Any, execution_time: float, memory_usage: int, expected_bytes: Optional[bytes] = None) -> Dict[str, Any]:
+    """
+    Parse a program's output for one test case and compare it with the expected output
+    
+    When the raw output is identical to the canonical form of the expected
+    output, it passes without being decoded or parsed. Anything else falls
+    back to parsing and structural comparison.
+    """
+    if expected_bytes is not None and stdout.strip() == expected_bytes:
+        logger.debug("✅ Test case passed! (exact output match)")
+        return {
+            "test_name": test_name,
+            "status": "passed",
+            "execution_time": execution_time,
+            "memory_usage": memory_usage
+        }
+    
+    # Parse output
+    try:
+        # Try to parse as JSON first, straight from the raw bytes
         try:
-            stdout_clean = result["stdout"].strip()
-            print(f"🧹 Cleaned stdout: {stdout_clean}")
+            actual_output = orjson.loads(stdout.strip())
+            logger.debug("✅ Parsed as JSON: %s", actual_output)
+        except orjson.JSONDecodeError:
+            stdout_clean = decode_output(stdout).strip()
+            
+            logger.debug("🧹 Cleaned stdout: %s", stdout_clean)
             
             if not stdout_clean:
-                print(f"❌ No output produced")
+                logger.debug("❌ No output produced")
                 return {
                     "test_name": test_name,
                     "status": "failed",
@@ -321,115 +837,163 @@ async def run_test_case(source_file: str, executable: str, config: Dict, test_ca
                     "execution_time": execution_time
                 }
             
-            # Try to parse as JSON first
+            logger.debug("⚠️ JSON parsing failed, trying ast.literal_eval...")
+            # If JSON parsing fails, try to evaluate the output as Python literal
             try:
-                actual_output = json.loads(stdout_clean)
-                print(f"✅ Parsed as JSON: {actual_output}")
-            except json.JSONDecodeError:
-                print(f"⚠️ JSON parsing failed, trying ast.literal_eval...")
-                # If JSON parsing fails, try to evaluate the output as Python literal
-                try:
-                    import ast
-                    actual_output = ast.literal_eval(stdout_clean)
-                    print(f"✅ Parsed as Python literal: {actual_output}")
-                except (ValueError, SyntaxError):
-                    # If both fail, treat as string output
-                    actual_output = stdout_clean
-                    print(f"⚠️ Treating as string: {actual_output}")
-                    
-        except Exception as e:
-            print(f"❌ Output parsing error: {str(e)}")
-            return {
-                "test_name": test_name,
-                "status": "failed",
-                "error": f"Output parsing error: {str(e)}. Raw output: {result['stdout'][:200]}",
-                "execution_time": execution_time
-            }
-        
-        # Compare outputs
-        print(f"🔍 Comparing outputs:")
-        print(f"   Expected: {expected_output} (type: {type(expected_output)})")
-        print(f"   Actual:   {actual_output} (type: {type(actual_output)})")
-        
-        if actual_output == expected_output:
-            print(f"✅ Test case passed!")
-            return {
-                "test_name": test_name,
-                "status": "passed",
-                "execution_time": execution_time,
-                "memory_usage": result.get("memory_usage", 0)
-            }
-        else:
-            print(f"❌ Test case failed - outputs don't match")
-            return {
-                "test_name": test_name,
-                "status": "failed",
-                "expected": expected_output,
-                "actual": actual_output,
-                "execution_time": execution_time
-            }
-            
+                import ast
+                actual_output = ast.literal_eval(stdout_clean)
+                logger.debug("✅ Parsed as Python literal: %s", actual_output)
+            except (ValueError, SyntaxError):
+                # If both fail, treat as string output
+                actual_output = stdout_clean
+                logger.debug("⚠️ Treating as string: %s", actual_output)
+                
     except Exception as e:
-        print(f"❌ Test case error: {str(e)}")
+        logger.debug("❌ Output parsing error: %s", e)
         return {
             "test_name": test_name,
-            "status": "error",
-            "error": str(e)
+            "status": "failed",
+            "error": f"Output parsing error: {str(e)}. Raw output: {decode_output(stdout[:200])}",
+            "execution_time": execution_time
+        }
+    
+    # Compare outputs
+    logger.debug("🔍 Comparing outputs:")
+    logger.debug("   Expected: %s (type: %s)", expected_output, type(expected_output))
+    logger.debug("   Actual:   %s (type: %s)", actual_output, type(actual_output))
+    
+    if actual_output == expected_output:
+        logger.debug("✅ Test case passed!")
+        return {
+            "test_name": test_name,
+            "status": "passed",
+            "execution_time": execution_time,
+            "memory_usage": memory_usage
+        }
+    else:
+        logger.debug("❌ Test case failed - outputs don't match")
+        return {
+            "test_name": test_name,
+            "status": "failed",
+            "expected": expected_output,
+            "actual": actual_output,
+            "execution_time": execution_time
         }
 
-async def run_command(cmd: List[str], input_data: str = None, timeout: int = 10) -> Dict[str, Any]:
+async def run_command(cmd: List[str], input_data: Optional[bytes] = None, timeout: int = 10, memory_limit: Optional[int] = None, idle_timeout: Optional[float] = None) -> Dict[str, Any]:
     """
     Run a command with timeout and resource limits
+    
+    input_data is written to stdin as-is, without re-encoding, and stdout
+    and stderr are returned as raw bytes; use decode_output where text is
+    needed. memory_limit caps the address space in bytes. idle_timeout, if
+    given, also times the command out when that long passes without any
+    new stdout.
     """
     try:
-        # On macOS, preexec_fn can cause issues with asyncio, so we'll skip resource limits for now
+        # Limits are applied after the spawn rather than in preexec_fn, which
+        # would force fork+exec instead of posix_spawn (and is unsafe with threads)
         process = await asyncio.create_subprocess_exec(
             *cmd,
             stdin=asyncio.subprocess.PIPE if input_data else None,
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE
         )
+        set_process_limits(process.pid, cpu_seconds=math.ceil(timeout) + 1, memory_limit=memory_limit)
+        
+        # Collect output into growable buffers; on timeout whatever was
+        # produced so far is still available
+        stdout_buffer = bytearray()
+        stderr_buffer = bytearray()
         
         try:
-            stdout, stderr = await asyncio.wait_for(
-                process.communicate(input=input_data.encode() if input_data else None),
+            await asyncio.wait_for(
+                asyncio.gather(
+                    feed_stdin(process.stdin, input_data),
+                    drain_stream(process.stdout, stdout_buffer, idle_timeout),
+                    drain_stream(process.stderr, stderr_buffer),
+                    process.wait()
+                ),
                 timeout=timeout
             )
             
             return {
                 "returncode": process.returncode,
-                "stdout": stdout.decode('utf-8', errors='replace'),
-                "stderr": stderr.decode('utf-8', errors='replace'),
+                "stdout": bytes(stdout_buffer),
+                "stderr": bytes(stderr_buffer),
                 "memory_usage": 0  # TODO: Implement memory usage tracking
             }
             
         except asyncio.TimeoutError:
             process.kill()
-            await process.wait()
+            await asyncio.shield(process.wait())
             return {
                 "returncode": -1,
-                "stdout": "",
-                "stderr": "Execution timeout",
+                "stdout": bytes(stdout_buffer),
+                "stderr": b"Execution timeout",
                 "memory_usage": 0
             }
+        except asyncio.CancelledError:
+            # Sibling test failed; don't leave the process running. The
+            # kill is immediate and shielding the wait lets the process be
+            # reaped even if this task is cancelled again meanwhile
+            process.kill()
+            await asyncio.shield(process.wait())
+            raise
             
     except Exception as e:
         return {
             "returncode": -1,
-            "stdout": "",
-            "stderr": str(e),
+            "stdout": b"",
+            "stderr": str(e).encode('utf-8', errors='replace'),
             "memory_usage": 0
         }
 
-def set_limits():
+async def feed_stdin(stdin: Optional[asyncio.StreamWriter], data: Optional[bytes]):
     """
-    Set resource limits for the subprocess
+    Write all input to a process in one call, then close its stdin
     """
-    # Limit memory to 256MB
-    resource.setrlimit(resource.RLIMIT_AS, (256 * 1024 * 1024, 256 * 1024 * 1024))
+    if stdin is None:
+        return
+    try:
+        if data:
+            stdin.write(data)
+            await stdin.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        # Process exited without reading all of its input
+        pass
+    finally:
+        stdin.close()
+
+async def drain_stream(stream: asyncio.StreamReader, buffer: bytearray, idle_timeout: Optional[float] = None):
+    """
+    Append everything read from a stream to buffer until EOF
     
-    # Limit CPU time to 30 seconds
-    resource.setrlimit(resource.RLIMIT_CPU, (30, 30))
+    Raises asyncio.TimeoutError if idle_timeout passes between two reads.
+    """
+    while True:
+        chunk = await asyncio.wait_for(stream.read(1 << 16), idle_timeout)
+        if not chunk:
+            break
+        buffer += chunk
+
+def set_process_limits(pid: int, cpu_seconds: Optional[int] = None, memory_limit: Optional[int] = None):
+    """
+    Set resource limits on a running process
     
-    # Limit number of processes
-    resource.setrlimit(resource.RLIMIT_NPROC, (10, 10))
\ No newline at end of file
+    Uses prlimit(2), so it is a no-op where that isn't available (macOS);
+    there the wall-clock timeout is the only limit. The CPU limit is a
+    backstop for the timeout; memory_limit caps the address space. A
+    freshly spawned process runs briefly before its limits apply; for
+    pooled workers they are in place long before a job arrives.
+    """
+    if not hasattr(resource, "prlimit"):
+        return
+    try:
+        if cpu_seconds is not None:
+            resource.prlimit(pid, resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds))
+        if memory_limit is not None:
+            resource.prlimit(pid, resource.RLIMIT_AS, (memory_limit, memory_limit))
+    except ProcessLookupError:
+        # Already exited
+        pass
@@ -0,0 +1,314 @@
+"""
+Pool of pre-started Python interpreters for running submissions
+
+Starting python3 costs tens of milliseconds, which dominates short golf
+solutions. The pool keeps interpreters running ahead of demand; each one
+waits on a pipe for a job (a wrapped solution's source and its stdin data),
+executes it as __main__ and reports its output in the same shape as
+evaluation.run_command (stdout and stderr as bytes).
+"""
+
+import asyncio
+import struct
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+# Runs inside each worker interpreter. The protocol uses duplicates of the
+# original stdin/stdout; fds 0 and 1 are pointed away from them so user
+# code can't read from or write into the protocol stream.
+#
+# Job:      an 8-byte header (source size, stdin size; big-endian uint32)
+#           followed by the UTF-8 source and the stdin bytes
+# Replies:  length-prefixed frames, a 1-byte kind and a big-endian uint32
+#           payload size: b"O" frames carry stdout bytes, and a final b"R"
+#           frame the return code (int32) followed by the stderr bytes
+WORKER_SOURCE = r'''
+import io
+import os
+import struct
+import sys
+import traceback
+import types
+
+protocol_in = os.fdopen(os.dup(0), "rb")
+protocol_out = os.fdopen(os.dup(1), "wb")
+devnull = os.open(os.devnull, os.O_RDWR)
+os.dup2(devnull, 0)
+os.dup2(2, 1)
+
+def send(kind, payload):
+    protocol_out.write(struct.pack(">cI", kind, len(payload)))
+    protocol_out.write(payload)
+    protocol_out.flush()
+
+class ForwardStdout(io.TextIOBase):
+    """Buffers stdout like a pipe would and forwards it on flush"""
+
+    def __init__(self):
+        self.parts = []
+        self.size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        # Strict, like a real UTF-8 stdout
+        data = text.encode("utf-8")
+        if data:
+            self.parts.append(data)
+            self.size += len(data)
+            if self.size >= 65536:
+                self.flush()
+        return len(text)
+
+    def flush(self):
+        if self.parts:
+            send(b"O", b"".join(self.parts))
+            self.parts = []
+            self.size = 0
+
+def run_job(source, data):
+    module = types.ModuleType("__main__")
+    saved = sys.stdin, sys.stdout, sys.stderr, sys.modules["__main__"], sys.argv
+    stdout = ForwardStdout()
+    stderr = io.StringIO()
+    sys.stdin = io.TextIOWrapper(io.BytesIO(data), encoding="utf-8")
+    sys.stdout = stdout
+    sys.stderr = stderr
+    sys.modules["__main__"] = module
+    # Same argv and filename as `python3 -c`
+    sys.argv = ["-c"]
+    returncode = 0
+    try:
+        exec(compile(source, "<string>", "exec"), module.__dict__)
+    except SystemExit as e:
+        if e.code is None:
+            returncode = 0
+        elif isinstance(e.code, int):
+            returncode = e.code
+        else:
+            print(e.code, file=stderr)
+            returncode = 1
+    except BaseException as e:
+        # Drop this function's frame so the traceback matches a direct run
+        traceback.print_exception(type(e), e, e.__traceback__.tb_next, file=stderr)
+        returncode = 1
+    finally:
+        sys.stdin, sys.stdout, sys.stderr, sys.modules["__main__"], sys.argv = saved
+    stdout.flush()
+    send(b"R", struct.pack(">i", returncode) + stderr.getvalue().encode("utf-8", "backslashreplace"))
+
+jobs_left = int(sys.argv[1])
+while jobs_left:
+    header = protocol_in.read(8)
+    if len(header) < 8:
+        break
+    source_size, size = struct.unpack(">II", header)
+    source = protocol_in.read(source_size).decode("utf-8", "surrogateescape")
+    run_job(source, protocol_in.read(size))
+    jobs_left -= 1
+'''
+
+JOB_HEADER = struct.Struct(">II")
+FRAME_HEADER = struct.Struct(">cI")
+RETURNCODE = struct.Struct(">i")
+
+class PythonWorker:
+    """A single pre-started interpreter running WORKER_SOURCE"""
+
+    def __init__(self, process: asyncio.subprocess.Process, max_jobs: int):
+        self.process = process
+        self.jobs_left = max_jobs
+
+    @property
+    def alive(self) -> bool:
+        return self.process.returncode is None
+
+    async def kill(self):
+        if self.alive:
+            self.process.kill()
+        # Reap the process even if the caller is cancelled while waiting
+        await asyncio.shield(self.process.wait())
+
+    async def run_job(self, source: bytes, data: bytes, stdout_parts: List[bytes], idle_timeout: Optional[float] = None) -> Tuple[int, bytes]:
+        """
+        Send one job and wait for its result
+
+        Stdout chunks are appended to stdout_parts as they arrive, so they
+        survive a timeout. Returns the return code and stderr; raises
+        asyncio.IncompleteReadError if the worker exits first, and
+        asyncio.TimeoutError if idle_timeout passes between two frames.
+        """
+        self.process.stdin.writelines((JOB_HEADER.pack(len(source), len(data)), source, data))
+        await self.process.stdin.drain()
+        reader = self.process.stdout
+        while True:
+            header = await asyncio.wait_for(reader.readexactly(FRAME_HEADER.size), idle_timeout)
+            kind, size = FRAME_HEADER.unpack(header)
+            payload = await reader.readexactly(size)
+            if kind == b"O":
+                stdout_parts.append(payload)
+                continue
+            (returncode,) = RETURNCODE.unpack_from(payload)
+            return returncode, payload[RETURNCODE.size:]
+
+class PythonWorkerPool:
+    """
+    Keeps `size` idle Python workers started ahead of demand
+
+    By default a worker runs a single job and exits, so submissions are as
+    isolated from each other as with a fresh process; only the interpreter
+    startup moves off the critical path. max_jobs > 1 reuses workers at the
+    cost of that isolation (imported modules persist between jobs).
+    prepare, if given, is called with the pid of each new worker (e.g. to
+    set resource limits) before it is used.
+    """
+
+    def __init__(self, command: List[str], size: int, max_jobs: int = 1, prepare: Optional[Callable[[int], None]] = None):
+        self.command = command
+        self.size = size
+        self.max_jobs = max_jobs
+        self.prepare = prepare
+        self._idle: List[PythonWorker] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._background: Set[asyncio.Task] = set()
+        # A single task tops up the idle list; jobs arriving while it is
+        # starting a worker wait for that worker instead of starting their own
+        self._replenisher: Optional[asyncio.Task] = None
+        self._spawning = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    async def _spawn(self) -> PythonWorker:
+        process = await asyncio.create_subprocess_exec(
+            *self.command, "-c", WORKER_SOURCE, str(self.max_jobs),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        if self.prepare is not None:
+            self.prepare(process.pid)
+        return PythonWorker(process, self.max_jobs)
+
+    async def _replenish(self):
+        while self._waiters or len(self._idle) < self.size:
+            self._spawning = 1
+            try:
+                worker = await self._spawn()
+            except Exception as e:
+                # Waiters start their own worker (and see the error themselves)
+                while self._waiters:
+                    waiter = self._waiters.popleft()
+                    if not waiter.done():
+                        waiter.set_exception(e)
+                raise
+            finally:
+                self._spawning = 0
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if not waiter.done():
+                    waiter.set_result(worker)
+                    break
+            else:
+                self._idle.append(worker)
+
+    def _run_in_background(self, coro):
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+
+    def _schedule_replenish(self):
+        if self._replenisher is None or self._replenisher.done():
+            self._replenisher = self._run_in_background(self._replenish())
+
+    async def _acquire(self) -> PythonWorker:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Subprocess transports belong to the loop that created them
+            for stale in self._idle:
+                if stale.alive:
+                    stale.process.kill()
+            self._loop = loop
+            self._idle = []
+            self._replenisher = None
+            self._spawning = 0
+            self._waiters = deque()
+
+        worker = None
+        while self._idle:
+            candidate = self._idle.pop()
+            if candidate.alive:
+                worker = candidate
+                break
+            self._reap(candidate)
+
+        if worker is None and self._spawning > len(self._waiters):
+            # A worker is already starting and nobody else is waiting for it
+            waiter = loop.create_future()
+            self._waiters.append(waiter)
+            try:
+                worker = await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+                    self._idle.append(waiter.result())
+                raise
+            except Exception:
+                worker = None
+        if worker is None:
+            worker = await self._spawn()
+
+        self._schedule_replenish()
+        return worker
+
+    def _reap(self, worker: PythonWorker):
+        """Let a retired worker exit (its job loop ends at EOF) and collect it"""
+        if worker.process.stdin is not None and not worker.process.stdin.is_closing():
+            worker.process.stdin.close()
+        self._run_in_background(worker.process.wait())
+
+    def _release(self, worker: PythonWorker):
+        worker.jobs_left -= 1
+        if worker.jobs_left > 0 and worker.alive:
+            self._idle.append(worker)
+        else:
+            self._reap(worker)
+
+    async def run(self, source: str, input_data: Optional[bytes], timeout: float, idle_timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Run Python source code in a worker with the given stdin
+
+        Returns the same dict as run_command: returncode, stdout, stderr
+        (both bytes) and memory_usage. Like run_command, the job also times
+        out when idle_timeout passes without new stdout. On timeout the
+        stdout produced so far is kept.
+        """
+        source_bytes = source.encode("utf-8", "surrogateescape")
+        worker = await self._acquire()
+        stdout_parts: List[bytes] = []
+
+        try:
+            returncode, stderr = await asyncio.wait_for(
+                worker.run_job(source_bytes, input_data or b"", stdout_parts, idle_timeout),
+                timeout=timeout
+            )
+        except asyncio.TimeoutError:
+            await worker.kill()
+            returncode, stderr = -1, b"Execution timeout"
+        except asyncio.IncompleteReadError:
+            exit_code = await worker.process.wait()
+            returncode, stderr = exit_code or -1, f"Worker exited unexpectedly (code {exit_code})".encode()
+        except asyncio.CancelledError:
+            await worker.kill()
+            raise
+        except (BrokenPipeError, ConnectionResetError) as e:
+            await worker.kill()
+            returncode, stderr = -1, f"Worker connection lost: {e}".encode()
+        else:
+            self._release(worker)
+
+        return {
+            "returncode": returncode,
+            "stdout": b"".join(stdout_parts),
+            "stderr": stderr,
+            "memory_usage": 0
+        }
@@ -0,0 +1,82 @@
+"""
+In-process queue of submissions waiting to be evaluated
+
+submit_code only records the submission and enqueues its id; a fixed
+number of worker tasks take ids off the queue and evaluate them, each
+reloading what it needs from the database. A burst of submissions therefore
+waits in the queue instead of starting that many evaluations at once.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Submissions evaluated at the same time (each one already runs its test
+# cases in parallel)
+EVAL_QUEUE_WORKERS = int(os.getenv("EVAL_QUEUE_WORKERS", str(os.cpu_count() or 1)))
+# Submissions allowed to wait for a worker; beyond this enqueue raises
+# asyncio.QueueFull so callers can turn new submissions away
+EVAL_QUEUE_MAX_PENDING = int(os.getenv("EVAL_QUEUE_MAX_PENDING", "1000"))
+
+class EvaluationQueue:
+    """
+    Runs handler(submission_id) for queued ids on `workers` worker tasks
+
+    Workers are started on first use (or by start()) in the running event
+    loop and cancelled by stop(). At most max_pending ids wait at a time.
+    """
+
+    def __init__(self, handler: Callable[[int], Awaitable[None]], workers: int = EVAL_QUEUE_WORKERS, max_pending: int = EVAL_QUEUE_MAX_PENDING):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def _work(self, queue: asyncio.Queue):
+        while True:
+            submission_id = await queue.get()
+            try:
+                await self.handler(submission_id)
+            except Exception:
+                logger.exception("❌ Evaluating submission %s failed", submission_id)
+            finally:
+                queue.task_done()
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        # Tasks and queues belong to the loop that created them
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._tasks = [asyncio.create_task(self._work(self._queue)) for _ in range(self.workers)]
+
+    async def stop(self):
+        tasks, self._tasks = self._tasks, []
+        self._loop = None
+        self._queue = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def enqueue(self, submission_id: int):
+        """
+        Queue a stored submission for evaluation (call from the event loop)
+
+        Raises asyncio.QueueFull when max_pending submissions are already waiting.
+        """
+        self.start()
+        self._queue.put_nowait(submission_id)
+
+    def full(self) -> bool:
+        """Whether enqueue would currently raise asyncio.QueueFull"""
+        return self._queue is not None and self._queue.full()
+
+    def pending(self) -> int:
+        """Number of submissions waiting for a worker"""
+        return self._queue.qsize() if self._queue is not None else 0
@@ -3,21 +3,62 @@ GolfPad - Google Code Golf 2025 Competition Platform
 FastAPI Backend Application
 """
 
+from contextlib import asynccontextmanager, suppress
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from logging.handlers import QueueHandler, QueueListener
+import asyncio
+import logging
 import os
+import queue
 
-from backend.database import engine, Base
+from backend.database import engine, Base, SessionLocal, warm_pool, create_missing_indexes
 from backend.routers import problems, submissions, users, leaderboard, batch_submissions
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
+create_missing_indexes()
+# Best submissions made before the summary table existed
+with SessionLocal() as db:
+    leaderboard.backfill_user_problem_best(db)
+
+# Application logs (the backend.* loggers) are handed to a queue and written
+# by a background thread, so request handlers never wait on log I/O
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+def configure_logging() -> QueueListener:
+    log_queue = queue.SimpleQueue()
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    backend_logger = logging.getLogger("backend")
+    backend_logger.setLevel(LOG_LEVEL)
+    backend_logger.addHandler(QueueHandler(log_queue))
+    backend_logger.propagate = False
+    return QueueListener(log_queue, handler)
+
+log_listener = configure_logging()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    log_listener.start()
+    # Prime the connection pool so early requests don't pay for connecting
+    warm_pool()
+    submissions.evaluation_queue.start()
+    await submissions.requeue_unfinished_submissions()
+    rank_refresher = asyncio.create_task(leaderboard.refresh_ranks_periodically())
+    yield
+    rank_refresher.cancel()
+    with suppress(asyncio.CancelledError):
+        await rank_refresher
+    await submissions.evaluation_queue.stop()
+    log_listener.stop()
 
 app = FastAPI(
     title="GolfPad API",
     description="Google Code Golf 2025 Competition Platform API",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # CORS middleware
@@ -2,7 +2,7 @@
 Database models for GolfPad
 """
 
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean, JSON, Float
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean, JSON, Float, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from backend.database import Base
@@ -21,6 +21,10 @@ class User(Base):
     
     # Relationships
     submissions = relationship("Submission", back_populates="user")
+    
+    # Load the database-set timestamps in the INSERT/UPDATE itself (RETURNING
+    # where supported), so they can be read after commit without a refresh
+    __mapper_args__ = {"eager_defaults": True}
 
 class Problem(Base):
     __tablename__ = "problems"
@@ -37,6 +41,9 @@ class Problem(Base):
     # Relationships
     submissions = relationship("Submission", back_populates="problem")
 
+# Problem list filtered by difficulty, in id order (keyset pagination)
+Index("ix_problems_difficulty_id", Problem.difficulty, Problem.id)
+
 class Submission(Base):
     __tablename__ = "submissions"
     
@@ -58,20 +65,66 @@ class Submission(Base):
     problem = relationship("Problem", back_populates="submissions")
     batch_submission = relationship("BatchSubmission", back_populates="submissions")
 
+# Keyset pagination of a problem's submissions, newest first, optionally per user
+Index("ix_submissions_problem_created", Submission.problem_id, Submission.created_at.desc(), Submission.id.desc())
+Index("ix_submissions_problem_user_created", Submission.problem_id, Submission.user_id, Submission.created_at.desc())
+
+class UserProblemBest(Base):
+    """
+    Each user's best passing submission per problem and language
+    
+    Maintained by update_user_stats as submissions pass, so leaderboards
+    don't aggregate over every submission ever made.
+    """
+    __tablename__ = "user_problem_best"
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    problem_id = Column(Integer, ForeignKey("problems.id"), primary_key=True)
+    language = Column(String(20), primary_key=True)
+    code_length = Column(Integer, nullable=False)
+    submission_id = Column(Integer, ForeignKey("submissions.id"), nullable=False)
+    submitted_at = Column(DateTime(timezone=True))  # Creation time of that submission
+
+# Per-problem leaderboard, optionally for one language
+Index(
+    "ix_user_problem_best_problem",
+    UserProblemBest.problem_id, UserProblemBest.language, UserProblemBest.code_length, UserProblemBest.submitted_at
+)
+# A user's scores: best length per problem, read from the index alone
+Index(
+    "ix_user_problem_best_user",
+    UserProblemBest.user_id, UserProblemBest.problem_id, UserProblemBest.code_length
+)
+# Per-language leaderboard: best lengths summed per user
+Index(
+    "ix_user_problem_best_language",
+    UserProblemBest.language, UserProblemBest.user_id, UserProblemBest.code_length
+)
+
 class UserStats(Base):
     __tablename__ = "user_stats"
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), unique=True, nullable=False)
-    total_score = Column(Integer, default=0)  # Sum of best scores for all solved problems
-    problems_solved = Column(Integer, default=0)
-    total_submissions = Column(Integer, default=0)
+    total_score = Column(Integer, nullable=False, default=0, server_default="0")  # Sum of best scores for all solved problems
+    problems_solved = Column(Integer, nullable=False, default=0, server_default="0")
+    total_submissions = Column(Integer, nullable=False, default=0, server_default="0")
     rank = Column(Integer)  # Global ranking
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     # Relationships
     user = relationship("User")
 
+# Global leaderboard and rank updates: ranked users in leaderboard order, so
+# the top rows are read straight from the index without sorting. Partial, as
+# users who haven't solved anything are never ranked.
+Index(
+    "ix_user_stats_leaderboard",
+    UserStats.total_score, UserStats.problems_solved.desc(), UserStats.user_id,
+    sqlite_where=UserStats.problems_solved > 0,
+    postgresql_where=UserStats.problems_solved > 0
+)
+
 class ProblemStats(Base):
     __tablename__ = "problem_stats"
     
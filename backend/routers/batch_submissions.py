@@ -2,15 +2,15 @@
 Batch submissions API routes for handling zip file uploads
 """
 
-import os
+import asyncio
+import io
 import zipfile
-import tempfile
 import re
-from typing import List
+from typing import BinaryIO, Callable, List, Tuple
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, BackgroundTasks
 from sqlalchemy.orm import Session
 
-from backend.database import get_db
+from backend.database import get_db, bulk_commit, SessionLocal
 from backend.models import BatchSubmission, Submission, Problem, User
 from backend.schemas import BatchSubmissionResponse, BatchSubmissionStatus
 from backend.routers.users import get_current_user
@@ -18,6 +18,10 @@ from backend.code_golf_scoring import calculate_code_score
 
 router = APIRouter()
 
+# Solution files inside an uploaded archive, e.g. task001.py or sub/task001.py
+# (zip member names always use forward slashes)
+TASK_FILE_RE = re.compile(r'(?:^|/)task(\d{3})\.py$')
+
 @router.post("/upload", response_model=BatchSubmissionResponse)
 async def upload_batch_submission(
     background_tasks: BackgroundTasks,
@@ -41,12 +45,16 @@ async def upload_batch_submission(
     db.commit()
     db.refresh(batch_submission)
     
+    # Read the upload while the request is still open; the file is
+    # released once the response has been sent
+    archive = io.BytesIO(await file.read())
+    
     # Process zip file in background
     background_tasks.add_task(
         process_zip_file,
         batch_submission.id,
-        file,
-        db
+        archive,
+        SessionLocal
     )
     
     return batch_submission
@@ -91,91 +99,109 @@ async def get_my_batch_submissions(
     
     return batches
 
-async def process_zip_file(batch_id: int, file: UploadFile, db: Session):
-    """Process uploaded zip file and create submissions"""
+def read_task_sources(archive: BinaryIO) -> Tuple[int, List[Tuple[int, str, int]]]:
+    """
+    Read and score every taskNNN.py file in a zip archive
     
-    batch = db.query(BatchSubmission).filter(BatchSubmission.id == batch_id).first()
-    if not batch:
-        return
+    Returns the number of matching files and a (task number, code, score)
+    tuple for each one that could be read. The archive is processed in
+    memory, without writing it or its members to disk, and members are
+    decompressed one at a time.
+    """
+    task_sources = []
+    with zipfile.ZipFile(archive) as zip_ref:
+        # Find all Python files matching task pattern
+        task_files = []
+        for info in zip_ref.infolist():
+            task_match = TASK_FILE_RE.search(info.filename)
+            if task_match:
+                task_files.append((info, int(task_match.group(1))))
+        
+        # Process each task file
+        for info, task_num in task_files:
+            try:
+                # Read code content (text mode, so newlines are normalized)
+                with io.TextIOWrapper(zip_ref.open(info), encoding='utf-8') as f:
+                    code_content = f.read()
+                
+                # Calculate code score using our scoring module
+                score_info = calculate_code_score(code_content, "python")
+                task_sources.append((task_num, code_content, score_info["score"]))
+                
+            except Exception as e:
+                print(f"Error processing {info.filename}: {str(e)}")
+                continue
+    
+    return len(task_files), task_sources
+
+async def process_zip_file(batch_id: int, archive: io.BytesIO, db_factory: Callable[[], Session] = SessionLocal):
+    """
+    Process uploaded zip file and create submissions
+    
+    Runs after the response is sent, so it opens its own session rather
+    than using the (already closed) request session.
+    """
     
+    db = db_factory()
     try:
-        # Create temporary directory
-        with tempfile.TemporaryDirectory() as temp_dir:
-            # Save uploaded file
-            zip_path = os.path.join(temp_dir, file.filename)
-            with open(zip_path, "wb") as buffer:
-                content = await file.read()
-                buffer.write(content)
+        batch = db.query(BatchSubmission).filter(BatchSubmission.id == batch_id).first()
+        if not batch:
+            return
+        
+        try:
+            # Decompressing and scoring is CPU-bound; keep it off the event loop
+            try:
+                total_files, task_sources = await asyncio.to_thread(read_task_sources, archive)
+            finally:
+                # The background task keeps a reference to the archive until
+                # this function returns; closing it frees the buffer now
+                archive.close()
             
-            # Extract zip file
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall(temp_dir)
-            
-            # Find all Python files matching task pattern
-            task_files = []
-            for root, dirs, files in os.walk(temp_dir):
-                for filename in files:
-                    if filename.endswith('.py') and re.match(r'task\d{3}\.py', filename):
-                        task_files.append(os.path.join(root, filename))
-            
-            batch.total_problems = len(task_files)
+            batch.total_problems = total_files
             db.commit()
             
+            # Look up every referenced problem with a single query; only the
+            # ids are needed, so the test case payloads aren't loaded
+            task_ids = {f"task{task_num:03d}" for task_num, _, _ in task_sources}
+            problem_ids = dict(
+                db.query(Problem.task_id, Problem.id).filter(Problem.task_id.in_(task_ids)).all()
+            )
+            
             total_score = 0
             processed = 0
+            submissions = []
             
-            # Process each task file
-            for task_file in task_files:
-                try:
-                    # Extract task number from filename
-                    filename = os.path.basename(task_file)
-                    task_match = re.match(r'task(\d{3})\.py', filename)
-                    if not task_match:
-                        continue
-                    
-                    task_num = int(task_match.group(1))
-                    task_id = f"task{task_num:03d}"
-                    
-                    # Find corresponding problem
-                    problem = db.query(Problem).filter(Problem.task_id == task_id).first()
-                    if not problem:
-                        continue
-                    
-                    # Read code content
-                    with open(task_file, 'r', encoding='utf-8') as f:
-                        code_content = f.read()
-                    
-                    # Calculate code score using our scoring module
-                    score_info = calculate_code_score(code_content, "python")
-                    code_length = score_info["score"]  # Use the calculated score
-                    
-                    # Create submission
-                    submission = Submission(
-                        user_id=batch.user_id,
-                        problem_id=problem.id,
-                        batch_submission_id=batch.id,
-                        language="python",
-                        code=code_content,
-                        code_length=code_length,
-                        status="completed"  # For now, just mark as completed
-                    )
-                    db.add(submission)
-                    
-                    total_score += code_length
-                    processed += 1
-                    
-                except Exception as e:
-                    print(f"Error processing {task_file}: {str(e)}")
+            for task_num, code_content, code_length in task_sources:
+                # Find corresponding problem
+                problem_id = problem_ids.get(f"task{task_num:03d}")
+                if problem_id is None:
                     continue
+                
+                # Create submission
+                submission = Submission(
+                    user_id=batch.user_id,
+                    problem_id=problem_id,
+                    batch_submission_id=batch.id,
+                    language="python",
+                    code=code_content,
+                    code_length=code_length,
+                    status="completed"  # For now, just mark as completed
+                )
+                submissions.append(submission)
+                
+                total_score += code_length
+                processed += 1
             
-            # Update batch submission
+            # Update batch submission, writing all submissions in one transaction
             batch.processed_problems = processed
             batch.total_score = total_score
             batch.status = "completed"
-            db.commit()
+            bulk_commit(db, submissions)
             
-    except Exception as e:
-        # Update batch with error
-        batch.status = "failed"
-        batch.error_message = str(e)
-        db.commit()
\ No newline at end of file
+        except Exception as e:
+            # Update batch with error
+            batch.status = "failed"
+            batch.error_message = str(e)
+            db.commit()
+    finally:
+        db.close()
@@ -2,186 +2,382 @@
 Leaderboard API routes
 """
 
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List, Optional
+from sqlalchemy import Integer, Subquery, bindparam, delete, func, insert, select, update
+from pydantic import TypeAdapter
+from typing import Dict, Hashable, List, Optional, Tuple
+import asyncio
+import logging
+import os
+import time
 
-from backend.database import get_db
-from backend.models import User, UserStats, Submission, Problem
+from backend.database import AsyncSessionLocal, get_db, get_async_db
+from backend.models import User, UserStats, Submission, Problem, UserProblemBest
 from backend.schemas import LeaderboardEntry, ProblemLeaderboardEntry
+from backend.routers.users import forget_cached_scores, get_current_user
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# user_stats.rank is a stored ranking; it is recomputed in the background at
+# most this often (seconds), and only after scores have changed, so reading
+# a user's rank stays a single-row lookup
+RANK_REFRESH_INTERVAL = float(os.getenv("RANK_REFRESH_INTERVAL", "30"))
+
+# Ranks stored by an earlier run may be out of date, so start stale
+_ranks_stale = True
+
+# Public leaderboards are the same for every caller, so response bodies are
+# kept for a short while and dropped early whenever scores or ranks change
+LEADERBOARD_CACHE_TTL = float(os.getenv("LEADERBOARD_CACHE_TTL", "60"))
+LEADERBOARD_CACHE_MAX_ENTRIES = 256
+# Lets browsers and proxies reuse a response for a little while too
+LEADERBOARD_CACHE_CONTROL = "public, max-age=30"
+
+_leaderboard_cache: Dict[Hashable, Tuple[float, bytes]] = {}
+
+def get_cached_leaderboard(key: Hashable) -> Optional[bytes]:
+    cached = _leaderboard_cache.get(key)
+    if cached is None or cached[0] < time.monotonic():
+        return None
+    return cached[1]
+
+def cache_leaderboard(key: Hashable, body: bytes) -> None:
+    if len(_leaderboard_cache) >= LEADERBOARD_CACHE_MAX_ENTRIES:
+        # Keys include free-form path values; don't let them pile up
+        _leaderboard_cache.clear()
+    _leaderboard_cache[key] = (time.monotonic() + LEADERBOARD_CACHE_TTL, body)
+
+def clear_leaderboard_cache() -> None:
+    """Invalidate cached leaderboards (call after scores or ranks change)"""
+    _leaderboard_cache.clear()
+
+# Rows come from our own queries, so entries are built with model_construct
+# (no validation) and serialized straight to JSON bytes
+LEADERBOARD_ADAPTER = TypeAdapter(List[LeaderboardEntry])
+PROBLEM_LEADERBOARD_ADAPTER = TypeAdapter(List[ProblemLeaderboardEntry])
+
+def leaderboard_response(body: bytes) -> Response:
+    return Response(body, media_type="application/json", headers={"Cache-Control": LEADERBOARD_CACHE_CONTROL})
+
+def best_submission_per_user(problem_id: int, language: Optional[str] = None) -> Subquery:
+    """
+    Each user's best passing submission for a problem, as a subquery
+    
+    The shortest code wins and the earliest submission breaks ties. Read
+    from user_problem_best; across languages, rows are numbered per user
+    with ROW_NUMBER() so each user still appears exactly once.
+    """
+    columns = (
+        UserProblemBest.user_id,
+        UserProblemBest.language,
+        UserProblemBest.code_length,
+        UserProblemBest.submitted_at.label('created_at')
+    )
+    if language:
+        return select(*columns).where(
+            UserProblemBest.problem_id == problem_id,
+            UserProblemBest.language == language
+        ).subquery()
+    
+    ranked = select(
+        *columns,
+        func.row_number().over(
+            partition_by=UserProblemBest.user_id,
+            order_by=(UserProblemBest.code_length.asc(), UserProblemBest.submitted_at.asc())
+        ).label('user_rank')
+    ).where(
+        UserProblemBest.problem_id == problem_id
+    ).subquery()
+    return select(
+        ranked.c.user_id, ranked.c.language, ranked.c.code_length, ranked.c.created_at
+    ).where(ranked.c.user_rank == 1).subquery()
+
+def rebuild_user_problem_best(db: Session) -> int:
+    """
+    Recompute user_problem_best from all passing submissions
+    
+    Needed once for submissions made before the table existed, or after
+    submissions are changed outside the API. Returns the number of rows.
+    """
+    ranked = select(
+        Submission.user_id,
+        Submission.problem_id,
+        Submission.language,
+        Submission.code_length,
+        Submission.id,
+        Submission.created_at,
+        func.row_number().over(
+            partition_by=(Submission.user_id, Submission.problem_id, Submission.language),
+            order_by=(Submission.code_length.asc(), Submission.created_at.asc(), Submission.id.asc())
+        ).label('best_rank')
+    ).where(Submission.status == "passed").subquery()
+    
+    db.execute(delete(UserProblemBest))
+    result = db.execute(
+        insert(UserProblemBest).from_select(
+            ["user_id", "problem_id", "language", "code_length", "submission_id", "submitted_at"],
+            select(
+                ranked.c.user_id, ranked.c.problem_id, ranked.c.language,
+                ranked.c.code_length, ranked.c.id, ranked.c.created_at
+            ).where(ranked.c.best_rank == 1)
+        )
+    )
+    db.commit()
+    clear_leaderboard_cache()
+    forget_cached_scores()
+    return result.rowcount
+
+def backfill_user_problem_best(db: Session) -> None:
+    """Fill user_problem_best if it is empty but passing submissions exist"""
+    if db.execute(select(UserProblemBest.user_id).limit(1)).first() is not None:
+        return
+    if db.execute(select(Submission.id).where(Submission.status == "passed").limit(1)).first() is not None:
+        rebuild_user_problem_best(db)
+
+# Leaderboard statements are built once; requests only supply bound values,
+# so each is compiled once and then served from the engine's statement cache
+
+# Users with their stats, ordered by total score (ascending for golf scoring)
+GLOBAL_LEADERBOARD_QUERY = select(
+    User.username,
+    UserStats.total_score,
+    UserStats.problems_solved
+).join(UserStats).where(
+    UserStats.problems_solved > 0  # Only users who solved at least one problem
+).order_by(
+    UserStats.total_score.asc(),  # Lower score is better in code golf
+    UserStats.problems_solved.desc()  # More problems solved as tiebreaker
+).limit(bindparam("limit", type_=Integer))
+
+# Best passing lengths per user, one row per solved problem
+_user_best_scores = select(
+    UserProblemBest.user_id,
+    func.sum(UserProblemBest.code_length).label('total_score'),
+    func.count().label('problems_solved')
+).where(
+    UserProblemBest.language == bindparam("language")
+).group_by(UserProblemBest.user_id).cte('user_best_scores')
+
+# Joined with user information
+LANGUAGE_LEADERBOARD_QUERY = select(
+    User.username,
+    _user_best_scores.c.total_score,
+    _user_best_scores.c.problems_solved
+).join(
+    _user_best_scores,
+    User.id == _user_best_scores.c.user_id
+).order_by(
+    _user_best_scores.c.total_score.asc(),
+    _user_best_scores.c.problems_solved.desc()
+).limit(bindparam("limit", type_=Integer))
+
 @router.get("/global", response_model=List[LeaderboardEntry])
 async def get_global_leaderboard(
     limit: int = Query(50, ge=1, le=100),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get global leaderboard based on total scores"""
-    # Get users with their stats, ordered by total score (ascending for golf scoring)
-    leaderboard_data = db.query(
-        User.username,
-        UserStats.total_score,
-        UserStats.problems_solved
-    ).join(UserStats).filter(
-        UserStats.problems_solved > 0  # Only users who solved at least one problem
-    ).order_by(
-        UserStats.total_score.asc(),  # Lower score is better in code golf
-        UserStats.problems_solved.desc()  # More problems solved as tiebreaker
-    ).limit(limit).all()
-    
-    leaderboard = []
-    for rank, (username, total_score, problems_solved) in enumerate(leaderboard_data, 1):
-        leaderboard.append(LeaderboardEntry(
+    cache_key = ("global", limit)
+    cached = get_cached_leaderboard(cache_key)
+    if cached is not None:
+        return leaderboard_response(cached)
+    
+    leaderboard_data = (await db.execute(GLOBAL_LEADERBOARD_QUERY, {"limit": limit})).all()
+    
+    leaderboard = [
+        LeaderboardEntry.model_construct(
             rank=rank,
             username=username,
             total_score=total_score,
             problems_solved=problems_solved
-        ))
+        )
+        for rank, (username, total_score, problems_solved) in enumerate(leaderboard_data, 1)
+    ]
     
-    return leaderboard
+    body = LEADERBOARD_ADAPTER.dump_json(leaderboard)
+    cache_leaderboard(cache_key, body)
+    return leaderboard_response(body)
 
 @router.get("/problem/{problem_id}", response_model=List[ProblemLeaderboardEntry])
 async def get_problem_leaderboard(
     problem_id: int,
     language: Optional[str] = Query(None),
     limit: int = Query(20, ge=1, le=50),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get leaderboard for a specific problem"""
     # Verify problem exists
-    problem = db.query(Problem).filter(Problem.id == problem_id).first()
-    if not problem:
+    if (await db.execute(select(Problem.id).where(Problem.id == problem_id))).first() is None:
         from fastapi import HTTPException
         raise HTTPException(status_code=404, detail="Problem not found")
     
-    # Base query for successful submissions
-    query = db.query(
-        User.username,
-        Submission.language,
-        Submission.code_length,
-        Submission.created_at
-    ).join(User).filter(
-        Submission.problem_id == problem_id,
-        Submission.status == "passed"
-    )
-    
-    # Filter by language if specified
-    if language:
-        query = query.filter(Submission.language == language)
-    
-    # Get the best (shortest) submission for each user
-    # First, get the minimum code length for each user
-    subquery = db.query(
-        Submission.user_id,
-        func.min(Submission.code_length).label('min_length')
-    ).filter(
-        Submission.problem_id == problem_id,
-        Submission.status == "passed"
-    )
+    # Best (shortest, then earliest) passing submission per user
+    best = best_submission_per_user(problem_id, language)
+    best_submissions = (await db.execute(
+        select(
+            User.username,
+            best.c.language,
+            best.c.code_length,
+            best.c.created_at
+        ).join(
+            best,
+            User.id == best.c.user_id
+        ).order_by(
+            best.c.code_length.asc(),
+            best.c.created_at.asc()  # Earlier submission wins in case of tie
+        ).limit(limit)
+    )).all()
     
-    if language:
-        subquery = subquery.filter(Submission.language == language)
-    
-    subquery = subquery.group_by(Submission.user_id).subquery()
-    
-    # Join with the subquery to get the best submissions
-    best_submissions = query.join(
-        subquery,
-        (Submission.user_id == subquery.c.user_id) & 
-        (Submission.code_length == subquery.c.min_length)
-    ).order_by(
-        Submission.code_length.asc(),
-        Submission.created_at.asc()  # Earlier submission wins in case of tie
-    ).limit(limit).all()
-    
-    leaderboard = []
-    for rank, (username, lang, code_length, submitted_at) in enumerate(best_submissions, 1):
-        leaderboard.append(ProblemLeaderboardEntry(
+    leaderboard = [
+        ProblemLeaderboardEntry.model_construct(
             rank=rank,
             username=username,
             code_length=code_length,
             language=lang,
             submitted_at=submitted_at
-        ))
+        )
+        for rank, (username, lang, code_length, submitted_at) in enumerate(best_submissions, 1)
+    ]
     
-    return leaderboard
+    return Response(PROBLEM_LEADERBOARD_ADAPTER.dump_json(leaderboard), media_type="application/json")
 
 @router.get("/languages/{language}", response_model=List[LeaderboardEntry])
 async def get_language_leaderboard(
     language: str,
     limit: int = Query(50, ge=1, le=100),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get leaderboard for a specific programming language"""
-    # Get best submissions for each user in the specified language
-    user_best_scores = db.query(
-        Submission.user_id,
-        func.sum(
-            db.query(func.min(Submission.code_length))
-            .filter(
-                Submission.user_id == Submission.user_id,
-                Submission.language == language,
-                Submission.status == "passed"
-            )
-            .group_by(Submission.problem_id)
-            .subquery().c.min
-        ).label('total_score'),
-        func.count(func.distinct(Submission.problem_id)).label('problems_solved')
-    ).filter(
-        Submission.language == language,
-        Submission.status == "passed"
-    ).group_by(Submission.user_id).subquery()
-    
-    # Join with user information
-    leaderboard_data = db.query(
-        User.username,
-        user_best_scores.c.total_score,
-        user_best_scores.c.problems_solved
-    ).join(
-        user_best_scores,
-        User.id == user_best_scores.c.user_id
-    ).order_by(
-        user_best_scores.c.total_score.asc(),
-        user_best_scores.c.problems_solved.desc()
-    ).limit(limit).all()
-    
-    leaderboard = []
-    for rank, (username, total_score, problems_solved) in enumerate(leaderboard_data, 1):
-        leaderboard.append(LeaderboardEntry(
+    cache_key = ("language", language, limit)
+    cached = get_cached_leaderboard(cache_key)
+    if cached is not None:
+        return leaderboard_response(cached)
+    
+    leaderboard_data = (await db.execute(LANGUAGE_LEADERBOARD_QUERY, {"language": language, "limit": limit})).all()
+    
+    leaderboard = [
+        LeaderboardEntry.model_construct(
             rank=rank,
             username=username,
             total_score=total_score or 0,
             problems_solved=problems_solved or 0
-        ))
+        )
+        for rank, (username, total_score, problems_solved) in enumerate(leaderboard_data, 1)
+    ]
     
-    return leaderboard
+    body = LEADERBOARD_ADAPTER.dump_json(leaderboard)
+    cache_leaderboard(cache_key, body)
+    return leaderboard_response(body)
 
-@router.post("/update-ranks")
-async def update_user_ranks(db: Session = Depends(get_db)):
-    """Update user rankings (admin function)"""
-    # Get all users with their total scores
-    users_with_scores = db.query(
-        UserStats.user_id,
-        UserStats.total_score,
-        UserStats.problems_solved
-    ).filter(
-        UserStats.problems_solved > 0
-    ).order_by(
-        UserStats.total_score.asc(),
-        UserStats.problems_solved.desc()
-    ).all()
-    
-    # Update ranks
-    for rank, (user_id, total_score, problems_solved) in enumerate(users_with_scores, 1):
-        user_stats = db.query(UserStats).filter(UserStats.user_id == user_id).first()
-        if user_stats:
-            user_stats.rank = rank
+@router.post("/rebuild-best")
+def rebuild_best_submissions(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Recompute every user's best submissions from scratch (admin function)
+    
+    A full scan of the submissions table, so it needs a logged-in user and
+    runs in the threadpool rather than on the event loop. Startup already
+    fills the table when it is empty (backfill_user_problem_best).
+    """
+    rebuilt_count = rebuild_user_problem_best(db)
+    return {
+        "message": f"Rebuilt {rebuilt_count} best submissions",
+        "rebuilt_count": rebuilt_count
+    }
+
+def refresh_user_ranks(db: Session) -> int:
+    """
+    Store every ranked user's position in user_stats.rank
+    
+    Ranks are computed by the database with a window function and written
+    with a single UPDATE ... FROM statement. Returns the number of users
+    ranked.
+    """
+    user_stats = UserStats.__table__
+    ranked = select(
+        user_stats.c.user_id,
+        func.row_number().over(
+            order_by=(
+                user_stats.c.total_score.asc(),
+                user_stats.c.problems_solved.desc()
+            )
+        ).label('new_rank')
+    ).where(
+        user_stats.c.problems_solved > 0
+    ).subquery()
+    
+    dialect = db.get_bind().dialect
+    if dialect.name == "sqlite" and dialect.dbapi.sqlite_version_info < (3, 33):
+        # No UPDATE ... FROM before SQLite 3.33: read the ranks once and
+        # write them back in one executemany
+        rows = db.execute(select(ranked.c.user_id, ranked.c.new_rank)).all()
+        if rows:
+            db.execute(
+                update(user_stats)
+                .where(user_stats.c.user_id == bindparam('ranked_user_id'))
+                .values(rank=bindparam('ranked_rank')),
+                [{"ranked_user_id": user_id, "ranked_rank": rank} for user_id, rank in rows]
+            )
+        updated_count = len(rows)
+    else:
+        result = db.execute(
+            update(user_stats)
+            .where(user_stats.c.user_id == ranked.c.user_id)
+            .values(rank=ranked.c.new_rank)
+        )
+        updated_count = result.rowcount
     
     db.commit()
+    clear_leaderboard_cache()
+    return updated_count
+
+def mark_ranks_stale() -> None:
+    """Have the next periodic refresh recompute ranks (call after scores change)"""
+    global _ranks_stale
+    _ranks_stale = True
+
+async def refresh_ranks_periodically(interval: float = RANK_REFRESH_INTERVAL) -> None:
+    """
+    Keep user_stats.rank up to date, recomputing it at most every `interval`
+    seconds and only after scores have changed
+    
+    Runs until cancelled; started by the app's lifespan.
+    """
+    global _ranks_stale
+    while True:
+        await asyncio.sleep(interval)
+        if not _ranks_stale:
+            continue
+        _ranks_stale = False
+        try:
+            async with AsyncSessionLocal() as db:
+                updated_count = await db.run_sync(refresh_user_ranks)
+            logger.debug("Refreshed ranks for %s users", updated_count)
+        except Exception:
+            _ranks_stale = True
+            logger.exception("❌ Refreshing user ranks failed")
+
+@router.post("/update-ranks")
+def update_user_ranks(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Update user rankings now (admin function)
+    
+    Rewrites every user's rank, so it needs a logged-in user and runs in
+    the threadpool. Ranks are also refreshed in the background shortly
+    after scores change.
+    """
+    updated_count = refresh_user_ranks(db)
     
     return {
-        "message": f"Updated ranks for {len(users_with_scores)} users",
-        "updated_count": len(users_with_scores)
-    }
\ No newline at end of file
+        "message": f"Updated ranks for {updated_count} users",
+        "updated_count": updated_count
+    }
@@ -3,35 +3,80 @@ Problems API routes
 """
 
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from typing import List, Optional
-import json
+from sqlalchemy import insert, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, load_only
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
 import os
+import orjson
 
-from backend.database import get_db
+from backend.database import get_db, get_async_db
 from backend.models import Problem, Submission, User
-from backend.schemas import ProblemResponse, ProblemDetail, ProblemCreate, SubmissionHistory, EvaluationResult, PaginatedResponse
+from backend.schemas import ProblemResponse, ProblemDetail, ProblemCreate, SubmissionHistory, EvaluationResult, PaginatedResponse, ProblemLeaderboardEntry
 from backend.evaluation import evaluate_code
+from backend.routers.leaderboard import PROBLEM_LEADERBOARD_ADAPTER, best_submission_per_user, leaderboard_response
+from backend.routers.users import forget_cached_scores
 from pydantic import BaseModel
 
 router = APIRouter()
 
+# Parsed test cases keyed by (problem id, updated_at). Edits made through
+# the ORM bump updated_at, so an edited problem gets a fresh entry.
+TEST_CASES_CACHE_MAX_ENTRIES = 1024
+
+_test_cases_cache: Dict[Tuple[int, Any], dict] = {}
+
+def get_problem_test_cases(db: Session, problem_id: int) -> Optional[dict]:
+    """
+    Return a problem's test cases, or None if the problem doesn't exist
+    
+    Only the problem's updated_at is read per call; the JSON column is
+    loaded and parsed once per version. The returned dict is shared
+    between callers and must not be modified.
+    """
+    updated_at = db.execute(select(Problem.updated_at).where(Problem.id == problem_id)).first()
+    if updated_at is None:
+        return None
+    key = (problem_id, updated_at[0])
+    test_cases = _test_cases_cache.get(key)
+    if test_cases is None:
+        test_cases = db.execute(select(Problem.test_cases).where(Problem.id == problem_id)).scalar_one()
+        if len(_test_cases_cache) >= TEST_CASES_CACHE_MAX_ENTRIES:
+            _test_cases_cache.clear()
+        _test_cases_cache[key] = test_cases
+    return test_cases
+
 @router.get("", response_model=PaginatedResponse)
 async def get_problems(
     page: int = Query(1, ge=1),
     size: int = Query(30, ge=1, le=100),
     difficulty: Optional[str] = Query(None),
+    after_id: Optional[int] = Query(None, description="Cursor: next_cursor of the previous page"),
     db: Session = Depends(get_db)
 ):
-    """Get list of problems with pagination and filtering"""
-    query = db.query(Problem)
+    """
+    Get list of problems with pagination and filtering
+
+    Pages can be addressed by number, or walked with after_id (keyset
+    pagination), which seeks straight to the page instead of scanning
+    and discarding the rows before it.
+    """
+    # The list doesn't include test cases, so that large column isn't loaded
+    query = db.query(Problem).options(load_only(
+        Problem.id, Problem.task_id, Problem.title, Problem.description, Problem.difficulty, Problem.created_at
+    ))
 
     if difficulty:
         query = query.filter(Problem.difficulty == difficulty)
 
     total = query.count()
-    offset = (page - 1) * size
-    items_db = query.offset(offset).limit(size).all()
+    query = query.order_by(Problem.id)
+    if after_id is not None:
+        items_db = query.filter(Problem.id > after_id).limit(size).all()
+    else:
+        offset = (page - 1) * size
+        items_db = query.offset(offset).limit(size).all()
     # Convert ORM objects to response models to ensure proper JSON encoding
     items = [ProblemResponse.model_validate(p, from_attributes=True) for p in items_db]
     pages = (total + size - 1) // size if size > 0 else 0
@@ -42,6 +87,7 @@ async def get_problems(
         "page": page,
         "size": size,
         "pages": pages,
+        "next_cursor": items_db[-1].id if len(items_db) == size else None,
     }
 
 @router.get("/{problem_id}", response_model=ProblemDetail)
@@ -58,36 +104,51 @@ async def get_problem_submissions(
     user_id: Optional[int] = Query(None),
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=100),
+    before_id: Optional[int] = Query(None, description="Cursor: id of the last submission already fetched"),
     db: Session = Depends(get_db)
 ):
-    """Get submissions for a specific problem"""
+    """
+    Get submissions for a specific problem, newest first
+    
+    Pass the id of the last submission received as before_id to get the
+    next page by seeking the (problem_id, created_at, id) index rather than
+    skipping rows with OFFSET.
+    """
     # Verify problem exists
     problem = db.query(Problem).filter(Problem.id == problem_id).first()
     if not problem:
         raise HTTPException(status_code=404, detail="Problem not found")
     
-    # Join with User table to get username
-    query = db.query(Submission, User.username).join(User).filter(Submission.problem_id == problem_id)
+    # Join with User table to get username, selecting only the columns
+    # SubmissionHistory needs rather than whole Submission rows
+    query = db.query(
+        Submission.id,
+        Submission.user_id,
+        User.username,
+        Submission.language,
+        Submission.code,
+        Submission.code_length,
+        Submission.status,
+        Submission.execution_time,
+        Submission.created_at
+    ).join(User, Submission.user_id == User.id).filter(Submission.problem_id == problem_id)
     
     if user_id:
         query = query.filter(Submission.user_id == user_id)
     
-    results = query.order_by(Submission.created_at.desc()).offset(skip).limit(limit).all()
+    query = query.order_by(Submission.created_at.desc(), Submission.id.desc())
+    if before_id is not None:
+        # The cursor row's own timestamp is compared as stored, so rows with
+        # the same created_at are split exactly by id
+        cursor_created_at = select(Submission.created_at).where(Submission.id == before_id).scalar_subquery()
+        query = query.filter(
+            tuple_(Submission.created_at, Submission.id) < tuple_(cursor_created_at, before_id)
+        )
+    else:
+        query = query.offset(skip)
     
     # Convert to SubmissionHistory format
-    submissions = []
-    for submission, username in results:
-        submissions.append(SubmissionHistory(
-            id=submission.id,
-            user_id=submission.user_id,
-            username=username,
-            language=submission.language,
-            code=submission.code,
-            code_length=submission.code_length,
-            status=submission.status,
-            execution_time=submission.execution_time,
-            created_at=submission.created_at
-        ))
+    submissions = [SubmissionHistory(**row._mapping) for row in query.limit(limit).all()]
     
     return submissions
 
@@ -99,12 +160,39 @@ async def create_problem(problem: ProblemCreate, db: Session = Depends(get_db)):
     if existing:
         raise HTTPException(status_code=400, detail="Problem with this task_id already exists")
     
-    db_problem = Problem(**problem.dict())
+    db_problem = Problem(**problem.model_dump())
     db.add(db_problem)
     db.commit()
+    forget_cached_scores()
     db.refresh(db_problem)
     return db_problem
 
+def read_problem_files(problems_dir: str, filenames: List[str]) -> List[dict]:
+    """
+    Parse problem JSON files into rows for the problems table
+    
+    Files that can't be read or parsed are reported and skipped.
+    """
+    rows = []
+    for filename in filenames:
+        task_id = filename[:-len('.json')]
+        try:
+            with open(os.path.join(problems_dir, filename), 'rb') as f:
+                test_data = orjson.loads(f.read())
+        except Exception as e:
+            print(f"Error loading {filename}: {e}")
+            continue
+        
+        # Create problem with basic info
+        rows.append({
+            "task_id": task_id,
+            "title": f"Task {task_id.replace('task', '')}",
+            "description": f"Code Golf Challenge - {task_id}",
+            "difficulty": "medium",
+            "test_cases": test_data
+        })
+    return rows
+
 @router.post("/load-from-files")
 async def load_problems_from_files(db: Session = Depends(get_db)):
     """Load problems from JSON files in google-code-golf-2025 directory"""
@@ -112,43 +200,23 @@ async def load_problems_from_files(db: Session = Depends(get_db)):
     if not os.path.exists(problems_dir):
         raise HTTPException(status_code=404, detail="Problems directory not found")
     
-    loaded_count = 0
-    skipped_count = 0
+    # One query for every task already loaded instead of one per file
+    existing_task_ids = set(db.execute(select(Problem.task_id)).scalars())
     
-    for filename in sorted(os.listdir(problems_dir)):
-        if not filename.endswith('.json'):
-            continue
-            
-        task_id = filename.replace('.json', '')
-        
-        # Check if problem already exists
-        existing = db.query(Problem).filter(Problem.task_id == task_id).first()
-        if existing:
-            skipped_count += 1
-            continue
-        
-        filepath = os.path.join(problems_dir, filename)
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                test_data = json.load(f)
-            
-            # Create problem with basic info
-            problem = Problem(
-                task_id=task_id,
-                title=f"Task {task_id.replace('task', '')}",
-                description=f"Code Golf Challenge - {task_id}",
-                difficulty="medium",
-                test_cases=test_data
-            )
-            
-            db.add(problem)
-            loaded_count += 1
-            
-        except Exception as e:
-            print(f"Error loading {filename}: {e}")
-            continue
+    with os.scandir(problems_dir) as entries:
+        filenames = sorted(entry.name for entry in entries if entry.name.endswith('.json'))
+    new_filenames = [name for name in filenames if name[:-len('.json')] not in existing_task_ids]
+    skipped_count = len(filenames) - len(new_filenames)
+    
+    # Reading and parsing is blocking work; keep it off the event loop
+    new_problems = await asyncio.to_thread(read_problem_files, problems_dir, new_filenames)
+    loaded_count = len(new_problems)
     
+    if new_problems:
+        db.execute(insert(Problem), new_problems)
     db.commit()
+    if new_problems:
+        forget_cached_scores()
     
     return {
         "message": f"Loaded {loaded_count} problems, skipped {skipped_count} existing problems",
@@ -156,60 +224,44 @@ async def load_problems_from_files(db: Session = Depends(get_db)):
         "skipped": skipped_count
     }
 
-@router.get("/{problem_id}/leaderboard")
+@router.get("/{problem_id}/leaderboard", responses={200: {"model": List[ProblemLeaderboardEntry]}})
 async def get_problem_leaderboard(
     problem_id: int,
     language: Optional[str] = Query(None),
     limit: int = Query(10, ge=1, le=50),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get leaderboard for a specific problem"""
     # Verify problem exists
-    problem = db.query(Problem).filter(Problem.id == problem_id).first()
-    if not problem:
+    if (await db.execute(select(Problem.id).where(Problem.id == problem_id))).first() is None:
         raise HTTPException(status_code=404, detail="Problem not found")
     
-    # Get best submissions for each user
-    query = db.query(
-        Submission.user_id,
-        User.username,
-        Submission.language,
-        Submission.code_length,
-        Submission.created_at
-    ).join(User).filter(
-        Submission.problem_id == problem_id,
-        Submission.status == "passed"
-    )
-    
-    if language:
-        query = query.filter(Submission.language == language)
-    
     # Get the best (shortest) submission for each user
-    subquery = db.query(
-        Submission.user_id,
-        db.func.min(Submission.code_length).label('min_length')
-    ).filter(
-        Submission.problem_id == problem_id,
-        Submission.status == "passed"
-    ).group_by(Submission.user_id).subquery()
-    
-    best_submissions = query.join(
-        subquery,
-        (Submission.user_id == subquery.c.user_id) & 
-        (Submission.code_length == subquery.c.min_length)
-    ).order_by(Submission.code_length.asc()).limit(limit).all()
-    
-    leaderboard = []
-    for rank, (user_id, username, lang, code_length, submitted_at) in enumerate(best_submissions, 1):
-        leaderboard.append({
-            "rank": rank,
-            "username": username,
-            "language": lang,
-            "code_length": code_length,
-            "submitted_at": submitted_at
-        })
+    best = best_submission_per_user(problem_id, language)
+    best_submissions = (await db.execute(
+        select(
+            User.username,
+            best.c.language,
+            best.c.code_length,
+            best.c.created_at
+        ).join(
+            best,
+            User.id == best.c.user_id
+        ).order_by(best.c.code_length.asc(), best.c.created_at.asc()).limit(limit)
+    )).all()
+    
+    leaderboard = [
+        ProblemLeaderboardEntry.model_construct(
+            rank=rank,
+            username=username,
+            language=lang,
+            code_length=code_length,
+            submitted_at=submitted_at
+        )
+        for rank, (username, lang, code_length, submitted_at) in enumerate(best_submissions, 1)
+    ]
     
-    return leaderboard
+    return leaderboard_response(PROBLEM_LEADERBOARD_ADAPTER.dump_json(leaderboard))
 
 class CodeExecutionRequest(BaseModel):
     code: str
@@ -222,14 +274,14 @@ async def execute_code(
     db: Session = Depends(get_db)
 ):
     """Execute code against problem test cases"""
-    # Get problem details
-    problem = db.query(Problem).filter(Problem.id == problem_id).first()
-    if not problem:
+    # Get problem test cases
+    test_cases = get_problem_test_cases(db, problem_id)
+    if test_cases is None:
         raise HTTPException(status_code=404, detail="Problem not found")
     
     # Execute code using evaluation module
     try:
-        result = await evaluate_code(request.code, request.language, problem.test_cases)
+        result = await evaluate_code(request.code, request.language, test_cases)
         return result
     except Exception as e:
         return EvaluationResult(
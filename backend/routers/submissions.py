@@ -2,35 +2,64 @@
 Submissions API routes
 """
 
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse
+import asyncio
 import io
+import logging
 import zipfile
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from sqlalchemy.sql import func
+from datetime import datetime
+from pydantic import TypeAdapter
 from typing import List, Optional
 
-from backend.database import get_db
-from backend.models import Submission, Problem, User, UserStats
-from backend.schemas import SubmissionCreate, SubmissionResponse, SubmissionHistory
-from backend.routers.users import get_current_user
+from backend.database import get_db, get_async_db
+from backend.models import Submission, Problem, User, UserStats, UserProblemBest
+from backend.schemas import SubmissionCreate, SubmissionResponse, SubmissionHistory, SubmissionSummary
+from backend.routers.users import get_current_user, forget_cached_scores
+from backend.routers.leaderboard import clear_leaderboard_cache, mark_ranks_stale
+from backend.routers.problems import get_problem_test_cases
 from backend.evaluation import evaluate_code
+from backend.evaluation_queue import EvaluationQueue
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+def queue_full_error() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Too many submissions are waiting for evaluation, please retry shortly",
+        headers={"Retry-After": "10"}
+    )
+
 # Support both with and without trailing slash for POST to avoid 405
 @router.post("", response_model=SubmissionResponse)
 @router.post("/", response_model=SubmissionResponse)
 async def submit_code(
     submission: SubmissionCreate,
-    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Submit code for evaluation"""
+    """
+    Submit code for evaluation
+    
+    Uses the async session: evaluation workers write on the same event
+    loop, and a synchronous write waiting on SQLite's lock would block
+    the loop and with it the worker holding the lock. Returns 503 without
+    storing anything while the evaluation queue is full.
+    """
+    if evaluation_queue.full():
+        raise queue_full_error()
+    
     # Verify problem exists
-    problem = db.query(Problem).filter(Problem.id == submission.problem_id).first()
-    if not problem:
+    problem_exists = await db.scalar(select(Problem.id).where(Problem.id == submission.problem_id))
+    if not problem_exists:
         raise HTTPException(status_code=404, detail="Problem not found")
     
     # Calculate code length
@@ -46,106 +75,198 @@ async def submit_code(
         status="pending"
     )
     db.add(db_submission)
-    db.commit()
-    db.refresh(db_submission)
-    
-    # Start evaluation in background
-    background_tasks.add_task(
-        evaluate_submission,
-        db_submission.id,
-        submission.code,
-        submission.language,
-        problem.test_cases
-    )
+    # id and created_at come back with the INSERT
+    await db.commit()
+    
+    # Queue for evaluation; the worker reloads the submission by id
+    try:
+        evaluation_queue.enqueue(db_submission.id)
+    except asyncio.QueueFull:
+        # Filled up while the submission was being stored
+        await db.delete(db_submission)
+        await db.commit()
+        raise queue_full_error()
     
     return db_submission
 
-async def evaluate_submission(submission_id: int, code: str, language: str, test_cases: dict):
-    """Background task to evaluate submission"""
-    from backend.database import SessionLocal
+async def evaluate_submission(submission_id: int):
+    """Evaluate a queued submission"""
+    from backend.database import AsyncSessionLocal
     
-    db = SessionLocal()
-    try:
-        submission = db.query(Submission).filter(Submission.id == submission_id).first()
-        if not submission:
-            return
-        
-        # Update status to running
-        submission.status = "running"
-        db.commit()
-        
-        # Evaluate code
-        result = await evaluate_code(code, language, test_cases)
-        
-        # Update submission with results
-        submission.status = result.status
-        submission.result = {
-            "test_results": result.test_results,
-            "error_message": result.error_message
-        }
-        submission.execution_time = result.execution_time
-        submission.memory_usage = result.memory_usage
-        
-        db.commit()
-        
-        # Update user stats if submission passed
-        if result.status == "passed":
-            await update_user_stats(db, submission.user_id, submission.problem_id, submission.code_length)
-        
-    except Exception as e:
-        # Handle evaluation error
-        submission = db.query(Submission).filter(Submission.id == submission_id).first()
-        if submission:
-            submission.status = "error"
-            submission.result = {"error_message": str(e)}
-            db.commit()
-    finally:
-        db.close()
-
-async def update_user_stats(db: Session, user_id: int, problem_id: int, code_length: int):
-    """Update user statistics after successful submission"""
-    # Get user stats
-    user_stats = db.query(UserStats).filter(UserStats.user_id == user_id).first()
-    if not user_stats:
-        user_stats = UserStats(user_id=user_id)
-        db.add(user_stats)
-    
-    # Check if this is user's first successful submission for this problem
-    previous_best = db.query(Submission).filter(
-        Submission.user_id == user_id,
-        Submission.problem_id == problem_id,
-        Submission.status == "passed"
-    ).order_by(Submission.code_length.asc()).first()
-    
-    is_new_problem = previous_best is None
-    is_better_score = previous_best and code_length < previous_best.code_length
-    
-    if is_new_problem:
-        user_stats.problems_solved += 1
-        user_stats.total_score += code_length
-    elif is_better_score:
-        # Update total score (subtract old best, add new best)
-        user_stats.total_score = user_stats.total_score - previous_best.code_length + code_length
-    
-    user_stats.total_submissions += 1
-    db.commit()
-
-@router.get("", response_model=List[SubmissionResponse])
+    async with AsyncSessionLocal() as db:
+        try:
+            submission = await db.get(Submission, submission_id)
+            if not submission:
+                return
+            test_cases = await db.run_sync(get_problem_test_cases, submission.problem_id)
+            
+            # Update status to running
+            submission.status = "running"
+            await db.commit()
+            
+            # Evaluate code
+            result = await evaluate_code(submission.code, submission.language, test_cases)
+            
+            # Update submission with results
+            submission.status = result.status
+            submission.result = {
+                "test_results": result.test_results,
+                "error_message": result.error_message
+            }
+            submission.execution_time = result.execution_time
+            submission.memory_usage = result.memory_usage
+            
+            await db.commit()
+            
+            # Update user stats if submission passed
+            if result.status == "passed":
+                await update_user_stats(
+                    db, submission.user_id, submission.problem_id, submission.code_length,
+                    submission.id, submission.language, submission.created_at
+                )
+            
+        except Exception as e:
+            # Handle evaluation error
+            await db.rollback()
+            submission = await db.get(Submission, submission_id)
+            if submission:
+                submission.status = "error"
+                submission.result = {"error_message": str(e)}
+                await db.commit()
+
+evaluation_queue = EvaluationQueue(evaluate_submission)
+
+async def requeue_unfinished_submissions() -> int:
+    """
+    Queue submissions left pending or running by a previous process
+    
+    Called at startup; queued ids only live in memory, so without this a
+    restart would leave those submissions unevaluated for good. Returns
+    the number queued.
+    """
+    from backend.database import AsyncSessionLocal
+    
+    async with AsyncSessionLocal() as db:
+        submission_ids = (await db.scalars(
+            select(Submission.id)
+            .where(Submission.status.in_(("pending", "running")))
+            .order_by(Submission.id)
+        )).all()
+    
+    for queued, submission_id in enumerate(submission_ids):
+        try:
+            evaluation_queue.enqueue(submission_id)
+        except asyncio.QueueFull:
+            logger.warning(
+                "⚠️ Evaluation queue full, %s unfinished submissions stay pending until the next restart",
+                len(submission_ids) - queued
+            )
+            return queued
+    return len(submission_ids)
+
+async def update_user_stats(
+    db: AsyncSession,
+    user_id: int,
+    problem_id: int,
+    code_length: int,
+    submission_id: int,
+    language: str,
+    submitted_at: datetime
+):
+    """
+    Update user statistics after successful submission
+    
+    user_problem_best is updated with an upsert that keeps the shorter (or,
+    on a tie, earlier) submission, and the stats totals are then recomputed
+    from it rather than adjusted by increments, so submissions evaluated
+    concurrently can't double-count a problem. The stats row is written
+    first: its row lock (or SQLite's write lock) makes concurrent updates
+    for the same user run one after another, each seeing the earlier ones.
+    """
+    upsert = sqlite_insert if db.get_bind().dialect.name == "sqlite" else postgresql_insert
+    stats = upsert(UserStats).values(user_id=user_id, total_submissions=1)
+    await db.execute(stats.on_conflict_do_update(
+        index_elements=[UserStats.user_id],
+        set_={"total_submissions": func.coalesce(UserStats.total_submissions, 0) + 1}
+    ))
+    
+    best = upsert(UserProblemBest).values(
+        user_id=user_id,
+        problem_id=problem_id,
+        language=language,
+        code_length=code_length,
+        submission_id=submission_id,
+        submitted_at=submitted_at
+    )
+    await db.execute(best.on_conflict_do_update(
+        index_elements=[UserProblemBest.user_id, UserProblemBest.problem_id, UserProblemBest.language],
+        set_={
+            "code_length": best.excluded.code_length,
+            "submission_id": best.excluded.submission_id,
+            "submitted_at": best.excluded.submitted_at
+        },
+        where=or_(
+            best.excluded.code_length < UserProblemBest.code_length,
+            and_(
+                best.excluded.code_length == UserProblemBest.code_length,
+                best.excluded.submitted_at < UserProblemBest.submitted_at
+            )
+        )
+    ))
+    
+    # Score is the sum of the user's best length per problem (across languages)
+    per_problem = select(
+        func.min(UserProblemBest.code_length).label('best_length')
+    ).where(
+        UserProblemBest.user_id == user_id
+    ).group_by(UserProblemBest.problem_id).subquery()
+    await db.execute(
+        update(UserStats).where(UserStats.user_id == user_id).values({
+            UserStats.total_score: select(func.coalesce(func.sum(per_problem.c.best_length), 0)).scalar_subquery(),
+            UserStats.problems_solved: select(func.count()).select_from(per_problem).scalar_subquery()
+        }).execution_options(synchronize_session=False)
+    )
+    
+    await db.commit()
+    clear_leaderboard_cache()
+    forget_cached_scores(user_id)
+    mark_ranks_stale()
+
+# The listing is built from our own rows, so it is serialized without
+# validating each submission again
+SUBMISSIONS_ADAPTER = TypeAdapter(List[SubmissionResponse])
+SUBMISSION_SUMMARIES_ADAPTER = TypeAdapter(List[SubmissionSummary])
+
+@router.get("", responses={200: {"model": List[SubmissionResponse]}})
 async def get_my_submissions(
     skip: int = 0,
     limit: int = 50,
     problem_id: Optional[int] = None,
+    include_code: bool = Query(True, description="Set to false to get summaries without code and test results"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Get current user's submissions"""
-    query = db.query(Submission).filter(Submission.user_id == current_user.id)
+    if include_code:
+        query = db.query(Submission)
+    else:
+        # Only the summary columns; code and results can be large
+        query = db.query(*(getattr(Submission, field) for field in SubmissionSummary.model_fields))
+    query = query.filter(Submission.user_id == current_user.id)
     
     if problem_id:
         query = query.filter(Submission.problem_id == problem_id)
     
     submissions = query.order_by(Submission.created_at.desc()).offset(skip).limit(limit).all()
-    return submissions
+    if not include_code:
+        summaries = [SubmissionSummary.model_construct(**row._mapping) for row in submissions]
+        return Response(SUBMISSION_SUMMARIES_ADAPTER.dump_json(summaries), media_type="application/json")
+    
+    items = [
+        SubmissionResponse.model_construct(**{field: getattr(submission, field) for field in SubmissionResponse.model_fields})
+        for submission in submissions
+    ]
+    return Response(SUBMISSIONS_ADAPTER.dump_json(items), media_type="application/json")
 
 @router.get("/{submission_id}", response_model=SubmissionResponse)
 async def get_submission(
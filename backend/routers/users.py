@@ -2,111 +2,305 @@
 Users API routes
 """
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-from jose import JWTError, jwt
-from datetime import datetime, timedelta
+from sqlalchemy import bindparam, func, or_, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only
+from pydantic import TypeAdapter
+import jwt
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from types import SimpleNamespace
+from typing import Any, Dict, Optional, Tuple
+import asyncio
+import base64
+import bcrypt
+import hashlib
+import hmac
+import logging
+import orjson
 import os
+import re
+import time
 
-from backend.database import get_db
+from backend.database import AsyncSessionLocal, get_async_db
 from backend.models import User, UserStats
 from backend.schemas import UserCreate, UserResponse, UserLogin, UserStatsResponse, UserScoresResponse, UserProblemScore
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 security = HTTPBearer()
 
 # JWT settings
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
+# The HMAC key as bytes, so it isn't re-encoded for every token
+SECRET_KEY_BYTES = SECRET_KEY.encode("utf-8")
 ALGORITHM = "HS256"
+# Tokens are signed without going through jwt.encode: the header segment
+# never changes, and the keyed HMAC state is set up once and copied per token
+TOKEN_HEADER_SEGMENT = base64.urlsafe_b64encode(orjson.dumps({"alg": ALGORITHM, "typ": "JWT"})).rstrip(b"=")
+TOKEN_SIGNER = hmac.new(SECRET_KEY_BYTES, digestmod=hashlib.sha256)
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Authenticated users are kept in memory for a short while, so most requests
+# resolve their user without a database query. The cost is staleness: changes
+# to a user's row made outside login (e.g. deactivating the account directly
+# in the database) reach get_current_user only after USER_CACHE_TTL seconds,
+# per worker process. Login re-caches the row it just read.
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))
+USER_CACHE_MAX_ENTRIES = 4096
+# Columns copied into the cache; the password hash isn't needed downstream
+USER_CACHE_COLUMNS = ("id", "username", "email", "is_active", "created_at", "updated_at")
+
+_user_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+
+# Per-user /me/scores responses, so refreshing the dashboard doesn't redo the
+# rollup; dropped early when the user's best solutions or the problems change
+SCORES_CACHE_TTL = float(os.getenv("SCORES_CACHE_TTL", "10"))
+SCORES_CACHE_MAX_ENTRIES = 10000
+
+_scores_cache: Dict[int, Tuple[float, bytes]] = {}
+
+# bcrypt work factor; each step doubles the cost of hashing and verifying
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+BCRYPT_HASH_RE = re.compile(r"\$2[aby]\$\d\d\$[./A-Za-z0-9]{53}")
+
+def _password_bytes(password: str) -> bytes:
+    # bcrypt only reads 72 bytes; longer passwords are pre-hashed so every
+    # byte still counts
+    data = password.encode("utf-8")
+    if len(data) > 72:
+        data = base64.b64encode(hashlib.sha256(data).digest())
+    return data
+
+def is_password_hash(stored_password: str) -> bool:
+    return BCRYPT_HASH_RE.fullmatch(stored_password) is not None
+
 def verify_password(plain_password, stored_password):
-    return plain_password == stored_password
+    """
+    Check a password against the stored value
+    
+    Accounts created before passwords were hashed still hold the plain
+    password; those are compared directly (login then upgrades them).
+    Hashing is slow on purpose, so call this off the event loop.
+    """
+    if is_password_hash(stored_password):
+        return bcrypt.checkpw(_password_bytes(plain_password), stored_password.encode("ascii"))
+    return hmac.compare_digest(plain_password.encode("utf-8"), stored_password.encode("utf-8"))
 
 def get_password_hash(password):
-    return password  # 直接返回明文密码
+    return bcrypt.hashpw(_password_bytes(password), bcrypt.gensalt(BCRYPT_ROUNDS)).decode("ascii")
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
+    """
+    Create an HS256 JWT carrying data and an expiry time
+    
+    Equivalent to jwt.encode, and verified by decode_access_token through
+    PyJWT; exp is stored as integer seconds since the epoch.
+    """
     to_encode = data.copy()
     if expires_delta:
-        expire = datetime.utcnow() + expires_delta
+        expire = datetime.now(timezone.utc) + expires_delta
     else:
-        expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
+        expire = datetime.now(timezone.utc) + timedelta(minutes=15)
+    to_encode.update({"exp": int(expire.timestamp())})
+    signing_input = TOKEN_HEADER_SEGMENT + b"." + base64.urlsafe_b64encode(orjson.dumps(to_encode)).rstrip(b"=")
+    signer = TOKEN_SIGNER.copy()
+    signer.update(signing_input)
+    signature = base64.urlsafe_b64encode(signer.digest()).rstrip(b"=")
+    return (signing_input + b"." + signature).decode("ascii")
+
+# Lookups on the authentication path are built once and take their values
+# as bound parameters, so they compile once and then hit the statement cache
+CURRENT_USER_QUERY = select(User).options(
+    load_only(*(getattr(User, column) for column in USER_CACHE_COLUMNS))
+).where(User.username == bindparam("username"))
+LOGIN_USER_QUERY = select(User).where(User.username == bindparam("username"))
+# At most two rows can match: one by username, one by email
+EXISTING_USER_QUERY = select(User.username, User.email).where(
+    or_(User.username == bindparam("username"), User.email == bindparam("email"))
+)
+# Stats columns, and for another user their username, in one query; the
+# stats columns are NULL if the user has no stats row yet. Counters are
+# NOT NULL for new databases; coalesce covers rows written before that.
+STATS_COLUMNS = (
+    func.coalesce(UserStats.total_score, 0).label("total_score"),
+    func.coalesce(UserStats.problems_solved, 0).label("problems_solved"),
+    func.coalesce(UserStats.total_submissions, 0).label("total_submissions"),
+    UserStats.rank
+)
+MY_STATS_QUERY = select(*STATS_COLUMNS).where(UserStats.user_id == bindparam("user_id"))
+USER_STATS_QUERY = select(User.username, UserStats.id.label("stats_id"), *STATS_COLUMNS).outerjoin(
+    UserStats, UserStats.user_id == User.id
+).where(User.id == bindparam("user_id"))
+# What a freshly created stats row holds
+DEFAULT_STATS = SimpleNamespace(total_score=0, problems_solved=0, total_submissions=0, rank=None)
+
+@lru_cache(maxsize=4096)
+def decode_access_token(token: str) -> Tuple[Optional[str], Optional[float]]:
+    """
+    Verify a token and return its subject and expiry time
+    
+    Decoding is pure, so each token is only verified once. Expiry is checked
+    by the caller because a cached result outlives the first check. Raises
+    jwt.InvalidTokenError for invalid tokens (which are not cached).
+    """
+    payload = jwt.decode(token, SECRET_KEY_BYTES, algorithms=[ALGORITHM], options={"require": ["exp", "sub"]})
+    return payload.get("sub"), payload.get("exp")
+
+def get_cached_user(username: str) -> Optional[User]:
+    """
+    Return a copy of a cached user, or None
+    
+    The copy isn't attached to any session; it carries the user's column
+    values but should not be added to a session or used for relationships.
+    """
+    cached = _user_cache.get(username)
+    if cached is None or cached[0] < time.monotonic():
+        return None
+    return User(**cached[1])
+
+def cache_user(user: User) -> None:
+    if len(_user_cache) >= USER_CACHE_MAX_ENTRIES:
+        _user_cache.clear()
+    values = {column: getattr(user, column) for column in USER_CACHE_COLUMNS}
+    _user_cache[user.username] = (time.monotonic() + USER_CACHE_TTL, values)
+
+def get_cached_scores(user_id: int) -> Optional[bytes]:
+    cached = _scores_cache.get(user_id)
+    if cached is None or cached[0] < time.monotonic():
+        return None
+    return cached[1]
+
+def cache_scores(user_id: int, body: bytes) -> None:
+    if len(_scores_cache) >= SCORES_CACHE_MAX_ENTRIES:
+        _scores_cache.clear()
+    _scores_cache[user_id] = (time.monotonic() + SCORES_CACHE_TTL, body)
+
+def forget_cached_scores(user_id: Optional[int] = None) -> None:
+    """
+    Invalidate cached scores for one user, or for everyone if user_id is None
+    
+    Call after a user's best solutions change, or for everyone after the
+    problem set changes.
+    """
+    if user_id is None:
+        _scores_cache.clear()
+    else:
+        _scores_cache.pop(user_id, None)
 
 async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    request: Request,
+    credentials: HTTPAuthorizationCredentials = Depends(security)
 ):
+    """
+    Resolve the bearer token to its user
+    
+    The user is memoized on request.state, so other dependencies and the
+    handler get the same object without another lookup, and across requests
+    in the user cache. A session is only opened when both miss.
+    """
+    user = getattr(request.state, "user", None)
+    if user is not None:
+        return user
+    
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-    except JWTError:
+        username, expires = decode_access_token(credentials.credentials)
+    except jwt.InvalidTokenError:
+        raise credentials_exception
+    if username is None or (expires is not None and expires <= time.time()):
         raise credentials_exception
     
-    user = db.query(User).filter(User.username == username).first()
+    user = get_cached_user(username)
     if user is None:
-        raise credentials_exception
+        async with AsyncSessionLocal() as db:
+            user = (await db.execute(CURRENT_USER_QUERY, {"username": username})).scalar_one_or_none()
+        if user is None:
+            raise credentials_exception
+        cache_user(user)
+    
+    request.state.user = user
     return user
 
-@router.post("/register", response_model=UserResponse)
-async def register_user(user: UserCreate, db: Session = Depends(get_db)):
+# Responses below are built from our own rows, so they are constructed
+# without validation and serialized straight to JSON
+def user_response(user: User) -> Response:
+    body = UserResponse.model_construct(**{field: getattr(user, field) for field in UserResponse.model_fields})
+    return Response(body.model_dump_json(), media_type="application/json")
+
+def stats_response(user_id: int, username: str, stats: Any) -> Response:
+    body = UserStatsResponse.model_construct(
+        user_id=user_id,
+        username=username,
+        total_score=stats.total_score,
+        problems_solved=stats.problems_solved,
+        total_submissions=stats.total_submissions,
+        rank=stats.rank
+    )
+    return Response(body.model_dump_json(), media_type="application/json")
+
+@router.post("/register", responses={200: {"model": UserResponse}})
+async def register_user(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
     """Register a new user"""
-    # Check if username already exists
-    existing_user = db.query(User).filter(User.username == user.username).first()
-    if existing_user:
+    # Check username and email in one query
+    existing = (await db.execute(EXISTING_USER_QUERY, {"username": user.username, "email": user.email})).all()
+    if any(row.username == user.username for row in existing):
         raise HTTPException(
             status_code=400,
             detail="Username already registered"
         )
-    
-    # Check if email already exists
-    existing_email = db.query(User).filter(User.email == user.email).first()
-    if existing_email:
+    if existing:
         raise HTTPException(
             status_code=400,
             detail="Email already registered"
         )
     
     # Create new user
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await asyncio.to_thread(get_password_hash, user.password)
     db_user = User(
         username=user.username,
         email=user.email,
         hashed_password=hashed_password
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    # Flush to get the user's id, then write the user and stats together
+    await db.flush()
     
     # Create user stats
     user_stats = UserStats(user_id=db_user.id)
     db.add(user_stats)
-    db.commit()
+    await db.commit()
     
-    return db_user
+    return user_response(db_user)
 
 @router.post("/login")
-async def login_user(user_login: UserLogin, db: Session = Depends(get_db)):
+async def login_user(user_login: UserLogin, db: AsyncSession = Depends(get_async_db)):
     """Login user and return access token"""
-    user = db.query(User).filter(User.username == user_login.username).first()
-    if not user or not verify_password(user_login.password, user.hashed_password):
+    user = (await db.execute(LOGIN_USER_QUERY, {"username": user_login.username})).scalar_one_or_none()
+    if not user or not await asyncio.to_thread(verify_password, user_login.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    if not is_password_hash(user.hashed_password):
+        # Stored before passwords were hashed; replace it now that we have it
+        user.hashed_password = await asyncio.to_thread(get_password_hash, user_login.password)
+        await db.commit()
+    
+    # The client will use its token right away; start with a fresh copy
+    cache_user(user)
+    
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": user.username}, expires_delta=access_token_expires
@@ -121,105 +315,106 @@ async def login_user(user_login: UserLogin, db: Session = Depends(get_db)):
         }
     }
 
-@router.get("/me", response_model=UserResponse)
+@router.get("/me", responses={200: {"model": UserResponse}})
 async def get_current_user_info(current_user: User = Depends(get_current_user)):
     """Get current user information"""
-    return current_user
+    return user_response(current_user)
 
-@router.get("/{user_id}/stats", response_model=UserStatsResponse)
-async def get_user_stats(user_id: int, db: Session = Depends(get_db)):
-    """Get user statistics"""
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    stats = db.query(UserStats).filter(UserStats.user_id == user_id).first()
-    if not stats:
-        # Create default stats if not exists
-        stats = UserStats(user_id=user_id)
-        db.add(stats)
-        db.commit()
-        db.refresh(stats)
+async def create_default_stats(db: AsyncSession, user_id: int) -> None:
+    """
+    Create an empty stats row for a user who doesn't have one yet
     
-    return {
-        "user_id": user.id,
-        "username": user.username,
-        "total_score": stats.total_score,
-        "problems_solved": stats.problems_solved,
-        "total_submissions": stats.total_submissions,
-        "rank": stats.rank
-    }
+    Concurrent first requests may both get here; the insert skips the row
+    if another request created it first.
+    """
+    upsert = sqlite_insert if db.get_bind().dialect.name == "sqlite" else postgresql_insert
+    await db.execute(
+        upsert(UserStats)
+        .values(user_id=user_id, total_score=0, problems_solved=0, total_submissions=0)
+        .on_conflict_do_nothing(index_elements=[UserStats.user_id])
+    )
+    await db.commit()
 
-@router.get("/me/stats", response_model=UserStatsResponse)
+@router.get("/me/stats", responses={200: {"model": UserStatsResponse}})
 async def get_my_stats(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get current user's statistics"""
-    print(f"[users.me.stats] start user_id={current_user.id} username={current_user.username}")
-    stats = db.query(UserStats).filter(UserStats.user_id == current_user.id).first()
-    if not stats:
-        stats = UserStats(user_id=current_user.id)
-        db.add(stats)
-        db.commit()
-        db.refresh(stats)
-        print(f"[users.me.stats] created default stats for user_id={current_user.id}")
-    
-    print(f"[users.me.stats] total_score={stats.total_score or 0}, "
-          f"problems_solved={stats.problems_solved or 0}, "
-          f"total_submissions={stats.total_submissions or 0}, "
-          f"rank={stats.rank}")
-    return {
-        "user_id": current_user.id,
-        "username": current_user.username,
-        "total_score": stats.total_score or 0,
-        "problems_solved": stats.problems_solved or 0,
-        "total_submissions": stats.total_submissions or 0,
-        "rank": stats.rank
-    }
+    logger.debug("[users.me.stats] start user_id=%s username=%s", current_user.id, current_user.username)
+    stats = (await db.execute(MY_STATS_QUERY, {"user_id": current_user.id})).first()
+    if stats is None:
+        await create_default_stats(db, current_user.id)
+        stats = DEFAULT_STATS
+        logger.debug("[users.me.stats] created default stats for user_id=%s", current_user.id)
+    
+    logger.debug(
+        "[users.me.stats] total_score=%s, problems_solved=%s, total_submissions=%s, rank=%s",
+        stats.total_score, stats.problems_solved, stats.total_submissions, stats.rank
+    )
+    return stats_response(current_user.id, current_user.username, stats)
 
-@router.get("/me/scores", response_model=UserScoresResponse)
+@router.get("/{user_id}/stats", responses={200: {"model": UserStatsResponse}})
+async def get_user_stats(user_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Get user statistics"""
+    row = (await db.execute(USER_STATS_QUERY, {"user_id": user_id})).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    stats = row
+    if row.stats_id is None:
+        # Create default stats if not exists
+        await create_default_stats(db, user_id)
+        stats = DEFAULT_STATS
+    
+    return stats_response(user_id, row.username, stats)
+
+# Scores are built from our own query rows, so they are constructed without
+# validation and serialized (and cached) as JSON bytes
+SCORES_ADAPTER = TypeAdapter(UserScoresResponse)
+
+@router.get("/me/scores", responses={200: {"model": UserScoresResponse}})
 async def get_my_scores(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Compute per-problem scores for current user.
     Rule: score = 2500 - best passed code length; if no passed, 0.001."""
-    from sqlalchemy import func
-    from backend.models import Submission, Problem
-    print(f"[users.me.scores] start user_id={current_user.id} username={current_user.username}")
-    problems = db.query(Problem).all()
-    print(f"[users.me.scores] problems_count={len(problems)}")
-
-    best_lengths = db.query(
-        Submission.problem_id,
-        func.min(Submission.code_length).label('min_length')
-    ).filter(
-        Submission.user_id == current_user.id,
-        Submission.status == "passed"
-    ).group_by(Submission.problem_id).all()
-    print(f"[users.me.scores] best_lengths_raw={best_lengths}")
-    best_map = {pid: length for pid, length in best_lengths}
-    print(f"[users.me.scores] best_map={best_map}")
-
-    items: list[UserProblemScore] = []
-    total = 0.0
-    for p in problems:
-        min_len = best_map.get(p.id)
-        score = float(2500 - min_len) if min_len is not None else 0.001
-        # Round to 3 decimal places to avoid floating point noise
-        score = round(score, 3)
-        total += score
-        print(f"[users.me.scores] problem_id={p.id} title={p.title!r} "
-              f"min_len={min_len} score={score}")
-        items.append(UserProblemScore(
-            problem_id=p.id,
-            task_id=p.task_id,
-            title=p.title,
-            code_length=min_len,
-            score=score
-        ))
-    # Round total as well for consistency
-    total = round(total, 3)
-    print(f"[users.me.scores] total_score={total}")
-    return UserScoresResponse(total_score=total, items=items)
\ No newline at end of file
+    from sqlalchemy import case
+    from backend.models import Problem, UserProblemBest
+    logger.debug("[users.me.scores] start user_id=%s username=%s", current_user.id, current_user.username)
+    cached = get_cached_scores(current_user.id)
+    if cached is not None:
+        logger.debug("[users.me.scores] cache hit user_id=%s", current_user.id)
+        return Response(cached, media_type="application/json")
+
+    # Best passed length per problem (across languages), left-joined onto
+    # every problem and scored in the same query; the total is a window sum
+    # over all rows, so it arrives with them
+    best = select(
+        UserProblemBest.problem_id,
+        func.min(UserProblemBest.code_length).label('min_length')
+    ).where(
+        UserProblemBest.user_id == current_user.id
+    ).group_by(UserProblemBest.problem_id).subquery()
+    score = case((best.c.min_length.is_(None), 0.001), else_=2500 - best.c.min_length)
+    rows = (await db.execute(select(
+        Problem.id,
+        Problem.task_id,
+        Problem.title,
+        best.c.min_length,
+        score.label('score'),
+        func.sum(score).over().label('total_score')
+    ).outerjoin(best, best.c.problem_id == Problem.id).order_by(Problem.id))).all()
+    logger.debug("[users.me.scores] problems_count=%s", len(rows))
+
+    items = [
+        UserProblemScore.model_construct(problem_id=problem_id, task_id=task_id, title=title, code_length=min_len, score=score)
+        for problem_id, task_id, title, min_len, score, _ in rows
+    ]
+    # Round to 3 decimal places to avoid floating point noise
+    total = round(rows[0].total_score, 3) if rows else 0
+    logger.debug("[users.me.scores] total_score=%s", total)
+    body = SCORES_ADAPTER.dump_json(UserScoresResponse.model_construct(total_score=total, items=items))
+    cache_scores(current_user.id, body)
+    return Response(body, media_type="application/json")
@@ -2,14 +2,37 @@
 Pydantic schemas for request/response models
 """
 
-from pydantic import BaseModel, EmailStr
-from typing import List, Dict, Any, Optional
+from pydantic import AfterValidator, BaseModel, ConfigDict, PlainSerializer, WithJsonSchema
+from typing import Annotated, List, Dict, Any, Optional
 from datetime import datetime, timezone
+import re
+
+def utc_isoformat(value: datetime) -> str:
+    """ISO 8601 in UTC with a Z suffix; naive values (SQLite) are taken as UTC"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).isoformat().replace('+00:00', 'Z')
+
+# Datetime fields in responses; the serializer is compiled into each
+# model's schema, so it also applies to instances built with model_construct
+UTCDateTime = Annotated[datetime, PlainSerializer(utc_isoformat, return_type=str, when_used='json')]
+
+# A syntactic check is all registration needs; nothing is sent to the address
+EMAIL_RE = re.compile(r"[^@\s]+@[^@\s]+\.[^@\s]+")
+
+def check_email(value: str) -> str:
+    """Validate an email address's shape and lowercase its domain"""
+    if EMAIL_RE.fullmatch(value) is None:
+        raise ValueError("value is not a valid email address")
+    local, _, domain = value.rpartition("@")
+    return f"{local}@{domain.lower()}"
+
+Email = Annotated[str, AfterValidator(check_email), WithJsonSchema({"type": "string", "format": "email"})]
 
 # User schemas
 class UserBase(BaseModel):
     username: str
-    email: EmailStr
+    email: Email
 
 class UserCreate(UserBase):
     password: str
@@ -17,18 +40,9 @@ class UserCreate(UserBase):
 class UserResponse(UserBase):
     id: int
     is_active: bool
-    created_at: datetime
+    created_at: UTCDateTime
     
-    class Config:
-        from_attributes = True
-        json_encoders = {
-            datetime: lambda v: (
-                (v if v.tzinfo else v.replace(tzinfo=timezone.utc))
-                .astimezone(timezone.utc)
-                .isoformat()
-                .replace('+00:00', 'Z')
-            )
-        }
+    model_config = ConfigDict(from_attributes=True)
 
 class UserLogin(BaseModel):
     username: str
@@ -46,18 +60,9 @@ class ProblemCreate(ProblemBase):
 
 class ProblemResponse(ProblemBase):
     id: int
-    created_at: datetime
+    created_at: UTCDateTime
     
-    class Config:
-        from_attributes = True
-        json_encoders = {
-            datetime: lambda v: (
-                (v if v.tzinfo else v.replace(tzinfo=timezone.utc))
-                .astimezone(timezone.utc)
-                .isoformat()
-                .replace('+00:00', 'Z')
-            )
-        }
+    model_config = ConfigDict(from_attributes=True)
 
 class ProblemDetail(ProblemResponse):
     test_cases: Dict[str, Any]
@@ -79,18 +84,22 @@ class SubmissionResponse(SubmissionBase):
     result: Optional[Dict[str, Any]] = None
     execution_time: Optional[float] = None
     memory_usage: Optional[int] = None
-    created_at: datetime
+    created_at: UTCDateTime
     
-    class Config:
-        from_attributes = True
-        json_encoders = {
-            datetime: lambda v: (
-                (v if v.tzinfo else v.replace(tzinfo=timezone.utc))
-                .astimezone(timezone.utc)
-                .isoformat()
-                .replace('+00:00', 'Z')
-            )
-        }
+    model_config = ConfigDict(from_attributes=True)
+
+class SubmissionSummary(BaseModel):
+    """A submission without its code or test results, for list views"""
+    id: int
+    problem_id: int
+    language: str
+    code_length: int
+    status: str
+    execution_time: Optional[float] = None
+    memory_usage: Optional[int] = None
+    created_at: UTCDateTime
+    
+    model_config = ConfigDict(from_attributes=True)
 
 class SubmissionHistory(BaseModel):
     id: int
@@ -101,18 +110,9 @@ class SubmissionHistory(BaseModel):
     code_length: int
     status: str
     execution_time: Optional[float] = None
-    created_at: datetime
+    created_at: UTCDateTime
     
-    class Config:
-        from_attributes = True
-        json_encoders = {
-            datetime: lambda v: (
-                (v if v.tzinfo else v.replace(tzinfo=timezone.utc))
-                .astimezone(timezone.utc)
-                .isoformat()
-                .replace('+00:00', 'Z')
-            )
-        }
+    model_config = ConfigDict(from_attributes=True)
 
 # Stats schemas
 class UserStatsResponse(BaseModel):
@@ -123,8 +123,7 @@ class UserStatsResponse(BaseModel):
     total_submissions: int
     rank: Optional[int] = None
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class ProblemStatsResponse(BaseModel):
     problem_id: int
@@ -135,8 +134,7 @@ class ProblemStatsResponse(BaseModel):
     best_score: Optional[int] = None
     average_score: Optional[float] = None
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 # Leaderboard schemas
 class LeaderboardEntry(BaseModel):
@@ -150,17 +148,7 @@ class ProblemLeaderboardEntry(BaseModel):
     username: str
     code_length: int
     language: str
-    submitted_at: datetime
-    
-    class Config:
-        json_encoders = {
-            datetime: lambda v: (
-                (v if v.tzinfo else v.replace(tzinfo=timezone.utc))
-                .astimezone(timezone.utc)
-                .isoformat()
-                .replace('+00:00', 'Z')
-            )
-        }
+    submitted_at: UTCDateTime
 
 # Evaluation schemas
 class EvaluationResult(BaseModel):
@@ -182,6 +170,7 @@ class PaginatedResponse(BaseModel):
     page: int
     size: int
     pages: int
+    next_cursor: Optional[int] = None  # Pass as after_id to fetch the next page
 
 # Batch submission schemas
 class BatchSubmissionResponse(BaseModel):
@@ -193,19 +182,10 @@ class BatchSubmissionResponse(BaseModel):
     total_score: int
     status: str
     error_message: Optional[str] = None
-    created_at: datetime
-    updated_at: Optional[datetime] = None
+    created_at: UTCDateTime
+    updated_at: Optional[UTCDateTime] = None
     
-    class Config:
-        from_attributes = True
-        json_encoders = {
-            datetime: lambda v: (
-                (v if v.tzinfo else v.replace(tzinfo=timezone.utc))
-                .astimezone(timezone.utc)
-                .isoformat()
-                .replace('+00:00', 'Z')
-            )
-        }
+    model_config = ConfigDict(from_attributes=True)
 
 class BatchSubmissionStatus(BaseModel):
     id: int
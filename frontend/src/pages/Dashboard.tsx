@@ -54,7 +54,7 @@ const Dashboard: React.FC = () => {
       setLoading(true)
       const [statsResult, submissionsResult, scoresResult] = await Promise.allSettled([
         api.get('/users/me/stats'),
-        api.get('/submissions?limit=10'),
+        api.get('/submissions?limit=10&include_code=false'),
         api.get('/users/me/scores')
       ])
 
@@ -0,0 +1,90 @@
+"""
+Tests for the evaluation result cache
+"""
+
+import asyncio
+import itertools
+
+import pytest
+
+from backend import eval_cache, evaluation
+from backend.schemas import EvaluationResult
+
+TEST_CASES = {"train": [{"input": [[1]], "output": [[1]]}]}
+
+PASSED = EvaluationResult(status="passed", test_results=[{"message": "通过"}], execution_time=0.1, memory_usage=0)
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(eval_cache, "EVAL_CACHE_ENABLED", True)
+    monkeypatch.setattr(eval_cache, "EVAL_CACHE_PATH", str(tmp_path / "evaluations.sqlite3"))
+    monkeypatch.setattr(eval_cache, "_connection", None)
+    monkeypatch.setattr(eval_cache, "_puts_since_trim", 0)
+    yield eval_cache
+    if eval_cache._connection is not None:
+        eval_cache._connection.close()
+
+def key(name: str) -> str:
+    return eval_cache.evaluation_key(f"def p(g):return {name}", "python", "config", TEST_CASES)
+
+def test_miss_then_hit(cache):
+    assert cache.get(key("g")) is None
+    cache.put(key("g"), PASSED)
+    assert cache.get(key("g")) == PASSED
+    assert cache.get(key("0")) is None
+
+def test_key_covers_test_cases_but_not_their_order():
+    reordered = {"test": [], "train": TEST_CASES["train"]}
+    assert (
+        eval_cache.evaluation_key("code", "python", "config", {"train": TEST_CASES["train"], "test": []})
+        == eval_cache.evaluation_key("code", "python", "config", reordered)
+    )
+    assert (
+        eval_cache.evaluation_key("code", "python", "config", TEST_CASES)
+        != eval_cache.evaluation_key("code", "python", "config", {"train": []})
+    )
+
+def test_oldest_entries_are_trimmed_every_few_writes(cache, monkeypatch):
+    monkeypatch.setattr(cache, "EVAL_CACHE_MAX_ENTRIES", 2)
+    monkeypatch.setattr(cache, "EVAL_CACHE_TRIM_EVERY", 3)
+    clock = itertools.count(1000)
+    monkeypatch.setattr(cache.time, "time", lambda: next(clock))
+
+    cache.put(key("1"), PASSED)
+    cache.put(key("2"), PASSED)
+    cache.put(key("3"), PASSED)
+    assert cache.get(key("1")) is None
+    assert cache.get(key("2")) == PASSED
+    assert cache.get(key("3")) == PASSED
+
+    # Until the next trim the cache may run over its limit
+    cache.put(key("4"), PASSED)
+    assert cache.get(key("2")) == PASSED
+
+def run_twice(monkeypatch, result: EvaluationResult) -> int:
+    """Evaluate the same submission twice; returns how often it actually ran"""
+    calls = []
+
+    async def fake_run_evaluation(*args):
+        calls.append(args)
+        return result
+
+    monkeypatch.setattr(evaluation, "run_evaluation", fake_run_evaluation)
+    for _ in range(2):
+        assert asyncio.run(evaluation.evaluate_code("def p(g):return g", "python", TEST_CASES)) == result
+    return len(calls)
+
+def test_repeatable_results_are_reused(cache, monkeypatch):
+    assert run_twice(monkeypatch, PASSED) == 1
+
+@pytest.mark.parametrize("result", [
+    EvaluationResult(status="failed", test_results=[
+        {"test_name": "train_0", "status": "failed", "error": "Execution timeout"}
+    ]),
+    EvaluationResult(status="failed", test_results=[
+        {"test_name": "train_0", "status": "failed", "error": "Worker exited unexpectedly (code -9)"}
+    ]),
+    EvaluationResult(status="error", test_results=[], error_message="Compilation failed: out of memory"),
+])
+def test_non_repeatable_results_are_not_stored(cache, monkeypatch, result):
+    assert run_twice(monkeypatch, result) == 2
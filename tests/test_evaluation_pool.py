@@ -0,0 +1,144 @@
+"""
+Tests for the pre-started Python worker pool
+"""
+
+import asyncio
+import sys
+
+from backend.evaluation_pool import PythonWorkerPool
+
+SLEEP_FOREVER = "import time\ntime.sleep(60)\n"
+
+def make_pool(size: int = 1) -> PythonWorkerPool:
+    pool = PythonWorkerPool([sys.executable], size=size)
+    # Record every worker handed to a job and every worker started
+    pool.acquired = []
+    pool.spawned = 0
+    acquire, spawn = pool._acquire, pool._spawn
+
+    async def recording_acquire():
+        worker = await acquire()
+        pool.acquired.append(worker)
+        return worker
+
+    async def counting_spawn():
+        pool.spawned += 1
+        return await spawn()
+
+    pool._acquire = recording_acquire
+    pool._spawn = counting_spawn
+    return pool
+
+async def close(pool: PythonWorkerPool):
+    """Kill idle workers and wait for the pool's background tasks"""
+    if pool._replenisher is not None:
+        await asyncio.gather(pool._replenisher, return_exceptions=True)
+    for worker in pool._idle:
+        await worker.kill()
+    await asyncio.gather(*pool._background, return_exceptions=True)
+
+async def wait_until(condition, timeout: float = 10):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "condition not reached"
+        await asyncio.sleep(0.01)
+
+def test_runs_source_with_stdin():
+    async def scenario():
+        pool = make_pool()
+        try:
+            return await pool.run("import sys\nprint(sys.stdin.read().upper())\n", b"golf", timeout=10)
+        finally:
+            await close(pool)
+
+    result = asyncio.run(scenario())
+    assert result["returncode"] == 0
+    assert result["stdout"] == b"GOLF\n"
+
+def test_timeout_kills_worker():
+    async def scenario():
+        pool = make_pool()
+        try:
+            result = await pool.run(SLEEP_FOREVER, b"", timeout=0.5)
+            return result, pool.acquired[0]
+        finally:
+            await close(pool)
+
+    result, worker = asyncio.run(scenario())
+    assert result["returncode"] == -1
+    assert result["stderr"] == b"Execution timeout"
+    assert not worker.alive
+
+def test_idle_timeout_applies_between_outputs():
+    async def scenario():
+        pool = make_pool()
+        source = "import time\nprint(1, flush=True)\ntime.sleep(60)\n"
+        try:
+            start = asyncio.get_running_loop().time()
+            result = await pool.run(source, b"", timeout=60, idle_timeout=0.5)
+            return result, asyncio.get_running_loop().time() - start
+        finally:
+            await close(pool)
+
+    result, elapsed = asyncio.run(scenario())
+    assert result["stderr"] == b"Execution timeout"
+    # Output produced before the timeout is kept
+    assert result["stdout"] == b"1\n"
+    assert elapsed < 10
+
+def test_cancel_kills_worker():
+    async def scenario():
+        pool = make_pool()
+        try:
+            task = asyncio.create_task(pool.run(SLEEP_FOREVER, b"", timeout=60))
+            await wait_until(lambda: pool.acquired)
+            await asyncio.sleep(0.2)
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            else:
+                raise AssertionError("run() swallowed the cancellation")
+            return pool.acquired[0]
+        finally:
+            await close(pool)
+
+    worker = asyncio.run(scenario())
+    assert not worker.alive
+
+def test_worker_exiting_mid_job_returns_error():
+    async def scenario():
+        pool = make_pool()
+        try:
+            # The guard turns a hang into a test failure
+            return await asyncio.wait_for(pool.run("import os\nos._exit(3)\n", b"", timeout=60), 10)
+        finally:
+            await close(pool)
+
+    result = asyncio.run(scenario())
+    assert result["returncode"] == 3
+    assert result["stderr"].startswith(b"Worker exited unexpectedly")
+
+def test_pool_refills_to_size():
+    async def scenario():
+        pool = make_pool(size=3)
+        try:
+            await pool.run("pass\n", b"", timeout=10)
+            await wait_until(lambda: len(pool._idle) == pool.size)
+            await pool._replenisher
+            # The first job's own worker plus a full set of idle ones
+            first_spawned = pool.spawned
+
+            # Jobs take idle workers, and the pool tops itself up again
+            await asyncio.gather(*(pool.run("pass\n", b"", timeout=10) for _ in range(3)))
+            await wait_until(lambda: len(pool._idle) == pool.size)
+            await pool._replenisher
+            return first_spawned, pool.spawned, [worker.alive for worker in pool._idle]
+        finally:
+            await close(pool)
+
+    first_spawned, spawned, idle_alive = asyncio.run(scenario())
+    assert first_spawned == 4
+    assert spawned == 7
+    assert idle_alive == [True] * 3
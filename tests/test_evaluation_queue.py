@@ -0,0 +1,74 @@
+"""
+Tests for the in-process evaluation queue
+"""
+
+import asyncio
+
+import pytest
+
+from backend.evaluation_queue import EvaluationQueue
+
+def test_runs_handler_for_each_id():
+    async def scenario():
+        handled = []
+        done = asyncio.Event()
+
+        async def handler(submission_id):
+            handled.append(submission_id)
+            if len(handled) == 5:
+                done.set()
+
+        queue = EvaluationQueue(handler, workers=2)
+        for submission_id in range(1, 6):
+            queue.enqueue(submission_id)
+        await asyncio.wait_for(done.wait(), 10)
+        await queue.stop()
+        return handled
+
+    assert sorted(asyncio.run(scenario())) == [1, 2, 3, 4, 5]
+
+def test_failing_handler_does_not_stop_the_worker():
+    async def scenario():
+        handled = []
+        done = asyncio.Event()
+
+        async def handler(submission_id):
+            if submission_id == 1:
+                raise RuntimeError("boom")
+            handled.append(submission_id)
+            done.set()
+
+        queue = EvaluationQueue(handler, workers=1)
+        queue.enqueue(1)
+        queue.enqueue(2)
+        await asyncio.wait_for(done.wait(), 10)
+        await queue.stop()
+        return handled
+
+    assert asyncio.run(scenario()) == [2]
+
+def test_enqueue_raises_when_full():
+    async def scenario():
+        release = asyncio.Event()
+        started = asyncio.Event()
+
+        async def handler(submission_id):
+            started.set()
+            await release.wait()
+
+        queue = EvaluationQueue(handler, workers=1, max_pending=2)
+        queue.enqueue(1)
+        # The worker holds 1, leaving room for max_pending more
+        await asyncio.wait_for(started.wait(), 10)
+        queue.enqueue(2)
+        queue.enqueue(3)
+        assert queue.full()
+        assert queue.pending() == 2
+        with pytest.raises(asyncio.QueueFull):
+            queue.enqueue(4)
+
+        release.set()
+        await queue.stop()
+        assert queue.pending() == 0
+
+    asyncio.run(scenario())